@@ -0,0 +1,128 @@
+"""Benchmark the JSON decode paths used for Riot match-v5 payloads.
+
+Compares the old ``requests`` ``Response.json()`` path with the byte-level codecs
+in ``lambda_function`` (stdlib json, and orjson when installed), with and without
+gzip on the wire, plus both projected parses used by MATCH_DETAIL_PARSE_MODE=projected.
+
+Usage:
+    python bench_json_decode.py                  # synthetic ~400 KB match payload
+    python bench_json_decode.py match1.json ...  # real payloads saved from match-v5
+"""
+
+import argparse
+import gzip
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+import requests
+
+import lambda_function
+
+
+def _synthetic_match(target_bytes: int) -> Dict[str, Any]:
+    """A match-v5-shaped document padded out to roughly ``target_bytes``."""
+    participants = []
+    for index in range(10):
+        participant: Dict[str, Any] = {
+            "puuid": f"puuid-{index:02d}-" + "x" * 64,
+            "teamId": 100 if index < 5 else 200,
+            "championName": f"Champion{index}",
+            "teamPosition": "MIDDLE",
+            "win": index < 5,
+            "kills": index,
+            "deaths": 3,
+            "assists": 7,
+        }
+        participant.update({f"stat{key}": key * 1.25 for key in range(120)})
+        participant["challenges"] = {f"challenge{key}": key / 7 for key in range(120)}
+        participant["perks"] = {
+            "statPerks": {"defense": 5002, "flex": 5008, "offense": 5005},
+            "styles": [
+                {"style": 8000, "selections": [{"perk": 8005, "var1": 1, "var2": 2, "var3": 0}] * 4}
+            ],
+        }
+        participants.append(participant)
+
+    match = {
+        "metadata": {"matchId": "KR_1", "participants": [p["puuid"] for p in participants]},
+        "info": {
+            "gameDuration": 1800,
+            "platformId": "KR",
+            "queueId": 420,
+            "participants": participants,
+            "teams": [{"teamId": 100, "objectives": {}}, {"teamId": 200, "objectives": {}}],
+        },
+    }
+    size = len(json.dumps(match))
+    if size < target_bytes:
+        # Most of a real payload is per-participant stats; grow those to the target.
+        extra = (target_bytes - size) // (10 * 40)
+        for participant in participants:
+            participant["challenges"].update({f"extraChallenge{key}": key / 3 for key in range(extra)})
+    return match
+
+
+def _requests_json(body: bytes) -> Any:
+    response = requests.models.Response()
+    response._content = body
+    response.status_code = 200
+    response.encoding = None
+    return response.json()
+
+
+def _time_per_call(fn: Callable[[], Any], rounds: int) -> float:
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("payloads", nargs="*", help="match-v5 JSON files to decode")
+    parser.add_argument("--size-kb", type=int, default=400, help="synthetic payload size")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    bodies: List[bytes] = []
+    for path in args.payloads:
+        with open(path, "rb") as handle:
+            bodies.append(handle.read())
+    if not bodies:
+        bodies.append(json.dumps(_synthetic_match(args.size_kb * 1024)).encode("utf-8"))
+
+    headers = {"content-encoding": "gzip"}
+    for body in bodies:
+        compressed = gzip.compress(body)
+        print(
+            f"📦 payload {len(body) / 1024:.0f} KB, gzip {len(compressed) / 1024:.0f} KB "
+            f"({len(compressed) / len(body):.0%})"
+        )
+        cases: Dict[str, Callable[[], Any]] = {"requests Response.json()": lambda: _requests_json(body)}
+        for name, loads in lambda_function._JSON_CODECS.items():
+            cases[f"{name} from bytes"] = lambda loads=loads: loads(body)
+            cases[f"{name} from gzip bytes"] = lambda loads=loads: loads(
+                lambda_function._decode_content(headers, compressed)
+            )
+        puuid = (json.loads(body).get("metadata", {}).get("participants") or [""])[0]
+        projection = lambda_function._MatchProjection(puuid)
+        if "orjson" in lambda_function._JSON_CODECS:
+            cases["projected, orjson + trim"] = lambda: projection.project(
+                lambda_function._JSON_CODECS["orjson"](body)
+            )
+        cases["projected, json hook"] = lambda: projection.parse_with_hook(body)
+
+        baseline = None
+        for name, fn in cases.items():
+            seconds = _time_per_call(fn, args.rounds)
+            baseline = baseline or seconds
+            print(
+                f"  {name:<28} {seconds * 1000:8.2f} ms  "
+                f"{len(body) / seconds / 1e6:8.1f} MB/s  {baseline / seconds:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
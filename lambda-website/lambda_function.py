@@ -1,9 +1,22 @@
+import asyncio
 import base64
+import gzip
+import hashlib
 import json
+import math
 import os
-from collections import Counter
+import random
+import re
+import ssl
+import struct
+import tempfile
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlencode, urlsplit
 
 import requests
 
@@ -19,28 +32,143 @@ if boto3 is not None:
 else:
     print("boto3 not available")
 
+try:  # pragma: no cover - optional dependency for the HTTP/2 transport
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+except ImportError:  # pragma: no cover - HTTP/1.1 is used without it
+    h2 = None
+
+try:  # pragma: no cover - optional faster JSON parser
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json is used without it
+    orjson = None
+
 # --- Environment variables ---
 RIOT_API_KEY = os.environ.get("RIOT_API_KEY")
 CUSTOM_API_KEY = os.environ.get("CUSTOM_API_KEY")
 
 
-def _resolve_limit(var_name: str, minimum: int) -> int:
+def _resolve_limit(var_name: str, minimum: int, default: Optional[int] = None) -> int:
+    fallback = minimum if default is None else default
+    raw_value = os.environ.get(var_name)
+    try:
+        parsed = int(raw_value) if raw_value is not None else fallback
+    except (TypeError, ValueError):
+        parsed = fallback
+    return max(minimum, parsed)
+
+
+def _resolve_float(var_name: str, minimum: float, default: float) -> float:
     raw_value = os.environ.get(var_name)
     try:
-        parsed = int(raw_value) if raw_value is not None else minimum
+        parsed = float(raw_value) if raw_value is not None else default
     except (TypeError, ValueError):
-        parsed = minimum
+        parsed = default
     return max(minimum, parsed)
 
 
 MATCH_ID_LIMIT = _resolve_limit("MATCH_ID_LIMIT", 20)
 MATCH_DETAIL_LIMIT = _resolve_limit("MATCH_DETAIL_LIMIT", 20)
 MATCH_HISTORY_LIMIT = _resolve_limit("MATCH_HISTORY_LIMIT", 20)
+# Largest "depth" (detailed matches) a deep-history recap may ask for.
+MATCH_DEPTH_LIMIT = _resolve_limit("MATCH_DEPTH_LIMIT", 1, default=500)
+# Match IDs requested per page; Riot caps count at 100.
+MATCH_ID_PAGE_SIZE = min(100, _resolve_limit("MATCH_ID_PAGE_SIZE", 1, default=100))
+# Number of match-detail requests allowed in flight at once (1 = sequential).
+MATCH_FETCH_WORKERS = _resolve_limit("MATCH_FETCH_WORKERS", 1, default=4)
+# Idle keep-alive connections kept per Riot host; sized to the fetch concurrency.
+RIOT_POOL_MAXSIZE = _resolve_limit("RIOT_POOL_MAXSIZE", 1, default=MATCH_FETCH_WORKERS)
+RIOT_POOL_IDLE_SECONDS = _resolve_limit("RIOT_POOL_IDLE_SECONDS", 1, default=30)
+# Opt-in HTTP/2: one multiplexed connection per Riot host. Development / long-lived server
+# only: it needs the ``h2`` package, which the Lambda zip does not bundle.
+ENABLE_RIOT_HTTP2 = (os.environ.get("ENABLE_RIOT_HTTP2", "false").lower() in {"1", "true", "yes"})
+if ENABLE_RIOT_HTTP2 and h2 is None:
+    print("⚠️ ENABLE_RIOT_HTTP2 is set but h2 is not installed; using HTTP/1.1")
+# JSON parser for Riot responses: "auto" (orjson when installed), "orjson" or "json".
+RIOT_JSON_CODEC = os.environ.get("RIOT_JSON_CODEC", "auto").strip().lower()
+# "projected" keeps only what the recap reads from a match detail; "full" keeps everything.
+# Projection lowers the memory each parsed match holds, not parse CPU: with orjson it is a
+# full parse plus a trim, and with the stdlib codec the per-object hook is ~15% slower.
+MATCH_DETAIL_PARSE_MODE = os.environ.get("MATCH_DETAIL_PARSE_MODE", "full").strip().lower()
+# Assumed app limit until Riot reports the real one (development-key defaults).
+RIOT_APP_RATE_LIMIT = os.environ.get("RIOT_APP_RATE_LIMIT", "20:1,100:120")
+# Fraction of each Riot limit we allow ourselves to use.
+RIOT_RATE_LIMIT_HEADROOM = min(1.0, _resolve_float("RIOT_RATE_LIMIT_HEADROOM", 0.1, 0.9))
+# Retries for throttled/transient Riot failures; each call also has an overall budget.
+RIOT_MAX_RETRIES = _resolve_limit("RIOT_MAX_RETRIES", 0, default=3)
+RIOT_RETRY_BASE_SECONDS = _resolve_float("RIOT_RETRY_BASE_SECONDS", 0.05, 0.5)
+RIOT_RETRY_MAX_SECONDS = _resolve_float("RIOT_RETRY_MAX_SECONDS", 0.1, 8.0)
+RIOT_REQUEST_BUDGET_SECONDS = _resolve_float("RIOT_REQUEST_BUDGET_SECONDS", 1.0, 20.0)
+# Time kept back from the Lambda timeout for building and returning the response.
+LAMBDA_DEADLINE_MARGIN_MS = _resolve_limit("LAMBDA_DEADLINE_MARGIN_MS", 0, default=1000)
+# Stop starting match-detail fetches when less than this remains (capped at a third of the
+# time left when fetching starts), leaving room to build the response.
+DETAIL_FETCH_RESERVE_MS = _resolve_limit("DETAIL_FETCH_RESERVE_MS", 0, default=3000)
+# Remembered puuid -> platform mappings used to start Step 4 before match details arrive.
+PLATFORM_CACHE_SIZE = _resolve_limit("PLATFORM_CACHE_SIZE", 1, default=10000)
+# Riot ID -> PUUID lookups kept across warm invocations. Names can be changed, so entries expire.
+RIOT_ID_CACHE_SIZE = _resolve_limit("RIOT_ID_CACHE_SIZE", 1, default=10000)
+RIOT_ID_CACHE_TTL_SECONDS = _resolve_limit("RIOT_ID_CACHE_TTL_SECONDS", 1, default=3600)
+# Finished matches never change, so their raw match-v5 bodies are cached without a TTL:
+# in memory (bounded by bytes), on the container's /tmp disk, and in the shared tier.
+MATCH_CACHE_MEMORY_BYTES = _resolve_limit("MATCH_CACHE_MEMORY_BYTES", 0, default=32 * 1024 * 1024)
+MATCH_CACHE_DIR = os.environ.get("MATCH_CACHE_DIR", "/tmp/riot-match-cache").strip()
+MATCH_CACHE_DISK_BYTES = _resolve_limit("MATCH_CACHE_DISK_BYTES", 0, default=256 * 1024 * 1024)
+# Extracted (matchId, puuid) recap entries; a few hundred bytes each versus ~400 KB raw.
+MATCH_ENTRY_CACHE_SIZE = _resolve_limit("MATCH_ENTRY_CACHE_SIZE", 1, default=20000)
+# Platform status is the same for every player on a platform: serve it from memory for
+# PLATFORM_STATUS_FRESH_SECONDS, then stale (refreshing in the background) up to the max.
+PLATFORM_STATUS_FRESH_SECONDS = _resolve_limit("PLATFORM_STATUS_FRESH_SECONDS", 1, default=60)
+PLATFORM_STATUS_MAX_STALE_SECONDS = _resolve_limit(
+    "PLATFORM_STATUS_MAX_STALE_SECONDS", PLATFORM_STATUS_FRESH_SECONDS, default=900
+)
+# Summoner profile and league entries change at most once per game; returning players
+# get them from memory and a background refresh instead of two chained Riot calls.
+SUMMONER_CACHE_SIZE = _resolve_limit("SUMMONER_CACHE_SIZE", 1, default=10000)
+SUMMONER_CACHE_FRESH_SECONDS = _resolve_limit("SUMMONER_CACHE_FRESH_SECONDS", 1, default=300)
+SUMMONER_CACHE_MAX_STALE_SECONDS = _resolve_limit(
+    "SUMMONER_CACHE_MAX_STALE_SECONDS", SUMMONER_CACHE_FRESH_SECONDS, default=6 * 3600
+)
+# Per-player recap state (newest match IDs plus extracted entries). A returning player's
+# refresh fetches only the first RECAP_REFRESH_HEAD_COUNT match IDs and details for new games.
+RECAP_STATE_CACHE_SIZE = _resolve_limit("RECAP_STATE_CACHE_SIZE", 1, default=5000)
+RECAP_REFRESH_HEAD_COUNT = _resolve_limit("RECAP_REFRESH_HEAD_COUNT", 1, default=10)
+# Recent "not found" answers (unknown Riot IDs, matches that 404 or return bad JSON) are
+# remembered for roughly NEGATIVE_CACHE_TTL_SECONDS in a rotating Bloom filter sized for
+# NEGATIVE_CACHE_CAPACITY keys per generation at NEGATIVE_CACHE_FALSE_POSITIVE_RATE.
+NEGATIVE_CACHE_TTL_SECONDS = _resolve_limit("NEGATIVE_CACHE_TTL_SECONDS", 1, default=300)
+NEGATIVE_CACHE_CAPACITY = _resolve_limit("NEGATIVE_CACHE_CAPACITY", 1, default=100000)
+NEGATIVE_CACHE_FALSE_POSITIVE_RATE = min(
+    0.1, _resolve_float("NEGATIVE_CACHE_FALSE_POSITIVE_RATE", 1e-9, default=0.001)
+)
+# Serialized recap responses per (Riot ID as typed, region, filters, depth). Repeat requests
+# within the TTL skip the pipeline; rebuilds with the same recap keep their (weak) ETag.
+RESPONSE_CACHE_SIZE = _resolve_limit("RESPONSE_CACHE_SIZE", 1, default=1000)
+RESPONSE_CACHE_TTL_SECONDS = _resolve_limit("RESPONSE_CACHE_TTL_SECONDS", 1, default=60)
+# Directory for the file-backed shared cache (e.g. an EFS mount); unset disables it.
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", "").strip()
+# Consecutive failures (timeouts, connection errors, 5xx) that open a host's circuit
+# for an endpoint family, and how long it stays open before a single probe is let through.
+RIOT_BREAKER_FAILURE_THRESHOLD = _resolve_limit("RIOT_BREAKER_FAILURE_THRESHOLD", 1, default=5)
+RIOT_BREAKER_COOLDOWN_SECONDS = _resolve_float("RIOT_BREAKER_COOLDOWN_SECONDS", 1, default=30)
+# Last successful summoner/league/status responses, served while their dependency is down.
+RIOT_LAST_GOOD_CACHE_SIZE = _resolve_limit("RIOT_LAST_GOOD_CACHE_SIZE", 1, default=2000)
+RIOT_LAST_GOOD_TTL_SECONDS = _resolve_limit("RIOT_LAST_GOOD_TTL_SECONDS", 1, default=6 * 3600)
+# Optional hedging: re-send a match-detail request that is slower than this
+# percentile of recent detail latencies, and take whichever answer lands first.
+ENABLE_MATCH_HEDGING = (os.environ.get("ENABLE_MATCH_HEDGING", "false").lower() in {"1", "true", "yes"})
+MATCH_HEDGE_PERCENTILE = min(99, _resolve_limit("MATCH_HEDGE_PERCENTILE", 50, default=95))
+MATCH_HEDGE_MIN_SAMPLES = _resolve_limit("MATCH_HEDGE_MIN_SAMPLES", 1, default=20)
 
 DEFAULT_PLATFORM_BY_REGION = {
     "AMERICAS": "na1",
     "EUROPE": "euw1",
     "ASIA": "kr",
+    "SEA": "oc1",
 }
 
 _RAW_ALLOWED_ORIGINS = (os.environ.get("ALLOWED_ORIGINS") or "").strip()
@@ -52,6 +180,11 @@ BEDROCK_MODEL_ID = os.environ.get(
 )
 BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ.get("AWS_REGION", "us-east-1"))
 
+# Generated feedback keyed by a hash of (stats context, tone, model); re-clicking a tone
+# button or reloading the page is answered from memory instead of another model call.
+AI_FEEDBACK_CACHE_SIZE = _resolve_limit("AI_FEEDBACK_CACHE_SIZE", 1, default=500)
+AI_FEEDBACK_CACHE_TTL_SECONDS = _resolve_limit("AI_FEEDBACK_CACHE_TTL_SECONDS", 1, default=6 * 3600)
+
 _bedrock_client: Optional["boto3.client"] = None
 
 
@@ -76,22 +209,70 @@ def _build_cors_headers(event: Dict[str, Any]) -> Dict[str, str]:
         "Access-Control-Allow-Origin": allowed_origin,
         "Access-Control-Allow-Headers": (
             "Content-Type,Authorization,X-Amz-Date,X-Amz-Security-Token,"
-            "x-api-key,X-Api-Key"
+            "x-api-key,X-Api-Key,If-None-Match"
         ),
         "Access-Control-Allow-Methods": "OPTIONS,POST",
         "Access-Control-Allow-Credentials": "false",
+        "Access-Control-Expose-Headers": "ETag",
         "Vary": "Origin",
     }
 
 
-def _build_response(event: Dict[str, Any], status_code: int, body: Any) -> Dict[str, Any]:
+def _build_response(
+    event: Dict[str, Any],
+    status_code: int,
+    body: Any,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
     return {
         "statusCode": status_code,
-        "headers": _build_cors_headers(event),
+        "headers": dict(_build_cors_headers(event), **(headers or {})),
         "body": json.dumps(body) if not isinstance(body, str) else body,
     }
 
 
+def _etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    """True when the request's If-None-Match already names ``etag`` (or ``*``).
+
+    If-None-Match uses weak comparison, so ``W/`` prefixes are ignored on both sides.
+    """
+    headers = event.get("headers") or {}
+    raw = headers.get("if-none-match") or headers.get("If-None-Match") or ""
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in raw.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in {"*", opaque}:
+            return True
+    return False
+
+
+def _build_etag_response(event: Dict[str, Any], etag: str, body_text: str) -> Dict[str, Any]:
+    """200 with ``body_text``, or an empty 304 if the client already holds ``etag``."""
+    if _etag_matches(event, etag):
+        return _build_response(event, 304, "", {"ETag": etag})
+    return _build_response(event, 200, body_text, {"ETag": etag})
+
+
+def _store_recap_response(key: Any, body: Dict[str, Any]) -> Tuple[str, str]:
+    """Serialize a recap response and cache it; returns ``(etag, body text)``.
+
+    The ETag is weak: it covers everything except ``limits`` and ``diagnostics``,
+    which describe how the response was built rather than what it says. A
+    rebuild with the same recap therefore keeps its ETag (and clients holding
+    it keep getting 304s) while the body always carries its own metadata.
+    """
+    content = {name: value for name, value in body.items() if name not in {"limits", "diagnostics"}}
+    digest = hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    etag = f'W/"{digest[:32]}"'
+    body_text = json.dumps(body)
+    _response_cache.set(key, (etag, body_text))
+    return etag, body_text
+
+
 # ---------- Helpers ----------
 def _format_duration(seconds: float) -> str:
     total_seconds = max(0, int(round(seconds)))
@@ -118,27 +299,1472 @@ def _require_api_key(event: Dict[str, Any]) -> Tuple[bool, Optional[Dict[str, An
     return True, None
 
 
+_MATCH_TYPES = {"ranked", "normal", "tourney", "tutorial"}
+
+
+def _parse_match_filters(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate the optional match-ID filters and map them to Riot query params.
+
+    ``queue`` is a queue ID (420 = ranked solo), ``type`` one of Riot's match types,
+    and ``startTime``/``endTime`` epoch seconds. Raises ValueError on bad input.
+    """
+    filters: Dict[str, Any] = {}
+    queue = body.get("queue")
+    if queue not in (None, ""):
+        try:
+            # bool is an int subclass; "queue": true must not become queue 1.
+            if isinstance(queue, bool):
+                raise TypeError
+            filters["queue"] = int(queue)
+        except (TypeError, ValueError):
+            raise ValueError("queue must be a numeric queue ID") from None
+
+    match_type = body.get("type")
+    if match_type is not None and not isinstance(match_type, str):
+        raise ValueError(f"type must be one of: {', '.join(sorted(_MATCH_TYPES))}")
+    match_type = (match_type or "").strip().lower()
+    if match_type:
+        if match_type not in _MATCH_TYPES:
+            raise ValueError(f"type must be one of: {', '.join(sorted(_MATCH_TYPES))}")
+        filters["type"] = match_type
+
+    for key, alias in (("startTime", "start_time"), ("endTime", "end_time")):
+        value = body.get(key, body.get(alias))
+        if value in (None, ""):
+            continue
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            filters[key] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} must be epoch seconds") from None
+        if filters[key] < 0:
+            raise ValueError(f"{key} must be epoch seconds")
+
+    if filters.get("startTime", 0) > filters.get("endTime", float("inf")):
+        raise ValueError("startTime must not be after endTime")
+    return filters
+
+
 def _riot_headers() -> Dict[str, str]:
     if not RIOT_API_KEY:
         raise RuntimeError("RIOT_API_KEY not configured")
     return {"X-Riot-Token": RIOT_API_KEY}
 
 
-def _riot_get_json(
+# ---------- In-process caches ----------
+class _LRUCache:
+    """Bounded in-process LRU, optionally expiring entries after ``ttl_seconds``.
+
+    Lives at module scope so entries survive across warm invocations.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is not None and self.ttl_seconds is not None:
+            if time.monotonic() - item[0] > self.ttl_seconds:
+                del self._data[key]
+                item = None
+        if item is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class _ByteBudgetLRU:
+    """In-process LRU of ``bytes`` values bounded by their total size, not their count."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Any, bytes]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Any, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous)
+        self._data[key] = value
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+class _NegativeCache:
+    """Rotating Bloom filter of keys recently found not to exist.
+
+    Two generations are kept; lookups check both and additions go to the newest.
+    The newest is rotated out after ``ttl_seconds / 2`` or once it holds
+    ``capacity`` keys, so a key is remembered for between half and the full TTL
+    and memory stays fixed however many distinct bad keys arrive. False
+    positives are possible at about ``error_rate``; false negatives are not.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float, error_rate: float) -> None:
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bits / capacity * math.log(2)))
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._current_count = 0
+        self._rotated_at = time.monotonic()
+        self.stats = {"hits": 0, "added": 0, "rotations": 0}
+
+    def _positions(self, key: str) -> List[int]:
+        first, second = struct.unpack("<QQ", hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest())
+        return [(first + index * second) % self.bits for index in range(self.hash_count)]
+
+    def _rotate_if_due(self) -> None:
+        if (
+            time.monotonic() - self._rotated_at >= self.ttl_seconds / 2
+            or self._current_count >= self.capacity
+        ):
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._current_count = 0
+            self._rotated_at = time.monotonic()
+            self.stats["rotations"] += 1
+
+    def add(self, key: str) -> None:
+        self._rotate_if_due()
+        for position in self._positions(key):
+            self._current[position >> 3] |= 1 << (position & 7)
+        self._current_count += 1
+        self.stats["added"] += 1
+
+    def __contains__(self, key: str) -> bool:
+        self._rotate_if_due()
+        positions = self._positions(key)
+        for generation in (self._current, self._previous):
+            if all(generation[position >> 3] & (1 << (position & 7)) for position in positions):
+                self.stats["hits"] += 1
+                return True
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, current=self._current_count, bytes=2 * len(self._current))
+
+
+class _StaleWhileRevalidateCache:
+    """Async loader cache that answers from memory and refreshes behind the caller.
+
+    Values younger than ``fresh_seconds`` are returned as is. Older ones, up to
+    ``max_stale_seconds``, are still returned at once while a single background
+    refresh per key reloads them. Missing or expired keys are loaded inline.
+    Values for which ``cacheable`` is false (e.g. degraded fallbacks) are
+    returned but not stored.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        fresh_seconds: float,
+        max_stale_seconds: float,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> None:
+        self.fresh_seconds = fresh_seconds
+        self._values = _LRUCache(maxsize, ttl_seconds=max_stale_seconds)
+        self._cacheable = cacheable or (lambda _: True)
+        self._refreshing: Dict[Any, "asyncio.Future[None]"] = {}
+        self.stats: Counter = Counter()
+
+    async def get(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        item = self._values.get(key)
+        if item is not None:
+            loaded_at, value = item
+            if time.monotonic() - loaded_at < self.fresh_seconds:
+                self.stats["fresh"] += 1
+            else:
+                self.stats["stale"] += 1
+                self._refresh(key, loader)
+            return value
+        self.stats["misses"] += 1
+        return self._store(key, await loader())
+
+    def _store(self, key: Any, value: Any) -> Any:
+        if self._cacheable(value):
+            self._values.set(key, (time.monotonic(), value))
+        return value
+
+    def _refresh(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> None:
+        running = self._refreshing.get(key)
+        if running is not None and not running.done() and running.get_loop() is asyncio.get_running_loop():
+            return
+        # Deliberately not flushed with the shared-cache writes: the response never
+        # waits on a refresh. If the container freezes first, it finishes on the
+        # reused loop during a later invocation.
+        self._refreshing[key] = asyncio.ensure_future(self._run_refresh(key, loader))
+
+    async def _run_refresh(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> None:
+        # The task copied the triggering invocation's context; the refresh is not
+        # part of that response, so it must not inherit (or die on) its deadline.
+        _invocation_deadline.set(None)
+        try:
+            self._store(key, await loader())
+            self.stats["refreshes"] += 1
+        except Exception as exc:  # keep serving the stale value
+            self.stats["refreshErrors"] += 1
+            print(f"⚠️ Background refresh failed for {key!r}: {exc!r}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, size=len(self._values))
+
+
+# puuid -> platform host seen in that player's matches.
+_platform_by_puuid = _LRUCache(PLATFORM_CACHE_SIZE)
+
+# "routing:gamename#tag" (canonical) -> puuid.
+_puuid_by_riot_id = _LRUCache(RIOT_ID_CACHE_SIZE, ttl_seconds=RIOT_ID_CACHE_TTL_SECONDS)
+
+# _ai_feedback_cache_key(...) -> successful feedback payload (without the "cached" flag).
+_ai_feedback_cache = _LRUCache(AI_FEEDBACK_CACHE_SIZE, ttl_seconds=AI_FEEDBACK_CACHE_TTL_SECONDS)
+
+# (Riot ID as typed, routing, filters, depth) -> (etag, body text). The body echoes the
+# Riot ID as typed, so differently-cased lookups are not shared.
+_response_cache = _LRUCache(RESPONSE_CACHE_SIZE, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS)
+
+# "riot-id:<canonical>" and "match:<matchId>" keys that recently came back missing.
+_negative_cache = _NegativeCache(
+    NEGATIVE_CACHE_CAPACITY, NEGATIVE_CACHE_TTL_SECONDS, NEGATIVE_CACHE_FALSE_POSITIVE_RATE
+)
+
+
+def _canonical_riot_id(game_name: str, tag_line: str, routing: str) -> str:
+    """Riot IDs match case-insensitively; also ignore stray and repeated whitespace."""
+    name = " ".join(game_name.split()).casefold()
+    tag = "".join(tag_line.split()).casefold()
+    return f"{routing.lower()}:{name}#{tag}"
+
+
+class SharedCacheBackend:
+    """Key-value store shared between Lambda containers (e.g. DynamoDB, Redis).
+
+    Values are bytes. Implementations may block; they are called off the event
+    loop, and any exception they raise is treated as a cache miss.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+
+class LocalFileCacheBackend(SharedCacheBackend):
+    """Keeps each key as a file under ``directory``.
+
+    Used for the per-container /tmp tier, and as a stand-in shared tier when
+    pointed at storage several containers mount (``SHARED_CACHE_DIR``). Files
+    start with an 8-byte expiry timestamp (0 = never). Past ``max_bytes`` the
+    least recently read files are removed.
+    """
+
+    _HEADER = struct.Struct(">d")
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                data = handle.read()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = self._HEADER.unpack_from(data)
+        if expires_at and expires_at < time.time():
+            self._remove(path)
+            return None
+        os.utime(path)  # recency for eviction
+        return data[self._HEADER.size:]
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[int] = None) -> None:
+        path = self._path(key)
+        expires_at = time.time() + ttl_seconds if ttl_seconds else 0.0
+        # A unique temp file per write: concurrent writers (threads in this
+        # process or other containers on a shared mount) never share one.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(self._HEADER.pack(expires_at))
+                handle.write(value)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_path, path)  # readers never see a half-written file
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        if self.max_bytes is not None:
+            if self._bytes is None:
+                self._bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+            else:
+                self._bytes += self._HEADER.size + len(value) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+        )
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        self._bytes = total
+
+
+_shared_cache_backend: Optional[SharedCacheBackend] = None
+_shared_cache_stats: Counter = Counter()
+
+
+def set_shared_cache_backend(backend: Optional[SharedCacheBackend]) -> None:
+    """Install (or with ``None`` remove) the cross-container cache tier."""
+    global _shared_cache_backend
+    _shared_cache_backend = backend
+
+
+async def _shared_cache_get(key: str) -> Optional[bytes]:
+    backend = _shared_cache_backend
+    if backend is None:
+        return None
+    try:
+        value = await asyncio.to_thread(backend.get, key)
+    except Exception as exc:  # pragma: no cover - backend specific
+        _shared_cache_stats["errors"] += 1
+        print(f"⚠️ Shared cache get failed for {key}: {exc!r}")
+        return None
+    _shared_cache_stats["hits" if value is not None else "misses"] += 1
+    return value
+
+
+async def _shared_cache_set(key: str, value: bytes, ttl_seconds: Optional[int] = None) -> None:
+    backend = _shared_cache_backend
+    if backend is None:
+        return
+    try:
+        await asyncio.to_thread(backend.set, key, value, ttl_seconds)
+        _shared_cache_stats["writes"] += 1
+    except Exception as exc:  # pragma: no cover - backend specific
+        _shared_cache_stats["errors"] += 1
+        print(f"⚠️ Shared cache set failed for {key}: {exc!r}")
+
+
+# Shared-cache writes run alongside the recap instead of on its critical path;
+# lambda_handler_async gives stragglers a moment before the container freezes.
+_pending_cache_writes: "set[asyncio.Future[None]]" = set()
+SHARED_CACHE_FLUSH_SECONDS = 0.5
+
+
+def _schedule_cache_write(write: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(write)
+    _pending_cache_writes.add(task)
+    task.add_done_callback(_pending_cache_writes.discard)
+
+
+def _schedule_shared_cache_set(key: str, value: bytes, ttl_seconds: Optional[int] = None) -> None:
+    if _shared_cache_backend is not None:
+        _schedule_cache_write(_shared_cache_set(key, value, ttl_seconds))
+
+
+if SHARED_CACHE_DIR:
+    set_shared_cache_backend(LocalFileCacheBackend(SHARED_CACHE_DIR))
+
+
+class _MatchDetailCache:
+    """Raw match-v5 bodies by match ID: memory, then /tmp, then the shared tier.
+
+    Hits in a lower tier are copied into the tiers above it. There is no TTL;
+    a match's details are final once match-v5 returns them.
+    """
+
+    def __init__(self, memory_bytes: int, directory: str, disk_bytes: int) -> None:
+        self.memory = _ByteBudgetLRU(memory_bytes)
+        self.disk: Optional[LocalFileCacheBackend] = None
+        if directory and disk_bytes:
+            try:
+                self.disk = LocalFileCacheBackend(directory, max_bytes=disk_bytes)
+            except OSError as exc:  # pragma: no cover - read-only filesystem
+                print(f"⚠️ Match disk cache disabled: {exc!r}")
+        self.stats: Counter = Counter()
+
+    async def _disk_call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except (OSError, struct.error) as exc:
+            self.stats["diskErrors"] += 1
+            print(f"⚠️ Match disk cache error: {exc!r}")
+            return None
+
+    async def get(self, match_id: str) -> Optional[bytes]:
+        raw = self.memory.get(match_id)
+        if raw is not None:
+            self.stats["memoryHits"] += 1
+            return raw
+        if self.disk is not None:
+            raw = await self._disk_call(self.disk.get, f"match:{match_id}")
+            if raw is not None:
+                self.stats["diskHits"] += 1
+                self.memory.set(match_id, raw)
+                return raw
+        raw = await _shared_cache_get(f"match:{match_id}")
+        if raw is not None:
+            self.stats["sharedHits"] += 1
+            self._store_local(match_id, raw)
+            return raw
+        self.stats["misses"] += 1
+        return None
+
+    def _store_local(self, match_id: str, raw: bytes) -> None:
+        self.memory.set(match_id, raw)
+        if self.disk is not None:
+            _schedule_cache_write(self._disk_call(self.disk.set, f"match:{match_id}", raw))
+
+    def set(self, match_id: str, raw: bytes) -> None:
+        self._store_local(match_id, raw)
+        _schedule_shared_cache_set(f"match:{match_id}", raw)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, memory=self.memory.stats())
+
+
+_match_detail_cache = _MatchDetailCache(
+    MATCH_CACHE_MEMORY_BYTES, MATCH_CACHE_DIR, MATCH_CACHE_DISK_BYTES
+)
+
+# (match_id, puuid) -> (entry or None, platform_id) from _extract_match_entry.
+# Entries are shared between invocations, so they must be treated as read-only.
+_match_entries = _LRUCache(MATCH_ENTRY_CACHE_SIZE)
+
+# (puuid, routing, filters, depth) -> (newest match IDs, entries, platform host or None)
+# from the last complete recap for that player; read-only like _match_entries.
+_recap_states = _LRUCache(RECAP_STATE_CACHE_SIZE)
+_recap_refresh_stats: Counter = Counter()
+
+
+async def _flush_shared_cache_writes() -> None:
+    loop = asyncio.get_running_loop()
+    pending = [task for task in _pending_cache_writes if task.get_loop() is loop]
+    if pending:
+        await asyncio.wait(pending, timeout=SHARED_CACHE_FLUSH_SECONDS)
+
+
+# ---------- Async Riot client ----------
+# Riot calls go over asyncio streams rather than ``requests`` so that a single
+# event loop can keep many requests in flight without a thread per request.
+# Transport failures are re-raised as ``requests`` exceptions to keep the
+# handler's error contract unchanged.
+T = TypeVar("T")
+
+_ssl_contexts: Dict[bool, ssl.SSLContext] = {}
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_ssl_context(http2: bool = False) -> ssl.SSLContext:
+    context = _ssl_contexts.get(http2)
+    if context is None:
+        context = ssl.create_default_context(cafile=requests.utils.DEFAULT_CA_BUNDLE_PATH)
+        if http2:
+            context.set_alpn_protocols(["h2", "http/1.1"])
+        _ssl_contexts[http2] = context
+    return context
+
+
+def _run_coroutine(coro: Awaitable[T]) -> T:
+    """Run ``coro`` to completion on a module-level loop reused across warm invocations."""
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coro)
+
+
+async def _open_riot_connection(
+    host: str, port: int, use_tls: bool, http2: bool = False
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if use_tls:
+        return await asyncio.open_connection(
+            host, port, ssl=_get_ssl_context(http2), server_hostname=host
+        )
+    return await asyncio.open_connection(host, port)
+
+
+def _stdlib_json_loads(body: bytes) -> Any:
+    return json.loads(body.decode("utf-8"))
+
+
+# Codecs parse UTF-8 bytes straight off the wire; Riot always sends UTF-8 JSON.
+_JSON_CODECS: Dict[str, Callable[[bytes], Any]] = {"json": _stdlib_json_loads}
+if orjson is not None:
+    _JSON_CODECS["orjson"] = orjson.loads
+
+
+def _select_json_codec(name: str) -> Tuple[str, Callable[[bytes], Any]]:
+    if name == "auto":
+        name = "orjson" if "orjson" in _JSON_CODECS else "json"
+    if name not in _JSON_CODECS:
+        print(f"⚠️ JSON codec {name!r} unavailable; using json")
+        name = "json"
+    return name, _JSON_CODECS[name]
+
+
+_json_codec_name, _json_loads = _select_json_codec(RIOT_JSON_CODEC)
+
+
+def _decode_content(headers: Dict[str, str], body: bytes) -> bytes:
+    """Undo the Content-Encoding negotiated by ``Accept-Encoding: gzip, deflate``."""
+    encoding = headers.get("content-encoding", "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:  # raw deflate without the zlib wrapper
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def _close_writer(writer: asyncio.StreamWriter) -> None:
+    try:
+        writer.close()
+    except RuntimeError:  # owning loop already closed
+        pass
+
+
+class _PooledConnection:
+    __slots__ = ("reader", "writer", "loop", "last_used")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.last_used = time.monotonic()
+
+    def is_usable(self) -> bool:
+        return (
+            self.loop is asyncio.get_running_loop()
+            and not self.reader.at_eof()
+            and not self.writer.is_closing()
+            and time.monotonic() - self.last_used < RIOT_POOL_IDLE_SECONDS
+        )
+
+
+class _H2Connection:
+    """A multiplexed HTTP/2 connection; concurrent requests share it as streams.
+
+    A background task reads frames and resolves each stream's future once its
+    response has fully arrived.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.last_used = time.monotonic()
+        self.streams_opened = 0
+        self.closed = False
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+        )
+        self.conn.initiate_connection()
+        # Match payloads are large; don't stall them on the 64 KiB default windows.
+        self.conn.update_settings({h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: 2**20})
+        self.conn.increment_flow_control_window(2**24)
+        self.writer.write(self.conn.data_to_send())
+        # stream id -> [headers, body chunks, future]
+        self._streams: Dict[int, List[Any]] = {}
+        self._reader_task = asyncio.ensure_future(self._read_frames())
+
+    def is_usable(self) -> bool:
+        return (
+            not self.closed
+            and self.loop is asyncio.get_running_loop()
+            and not self.writer.is_closing()
+            and self.conn.open_outbound_streams < self.conn.remote_settings.max_concurrent_streams
+            and (self._streams or time.monotonic() - self.last_used < RIOT_POOL_IDLE_SECONDS)
+        )
+
+    async def request(self, headers: List[Tuple[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        stream_id = self.conn.get_next_available_stream_id()
+        future = self.loop.create_future()
+        self._streams[stream_id] = [{}, [], future]
+        self.streams_opened += 1
+        self.conn.send_headers(stream_id, headers, end_stream=True)
+        self.writer.write(self.conn.data_to_send())
+        try:
+            await self.writer.drain()
+            return await future
+        finally:
+            self.last_used = time.monotonic()
+            if self._streams.pop(stream_id, None) is not None and not self.closed:
+                # Abandoned (timeout/cancel): tell the server to stop sending.
+                try:
+                    self.conn.reset_stream(stream_id, h2.errors.ErrorCodes.CANCEL)
+                    self.writer.write(self.conn.data_to_send())
+                except (h2.exceptions.H2Error, RuntimeError):
+                    pass
+
+    def _finish(self, stream_id: int, error: Optional[BaseException] = None) -> None:
+        stream = self._streams.pop(stream_id, None)
+        if stream is None or stream[2].done():
+            return
+        headers, chunks, future = stream
+        if error is not None:
+            future.set_exception(error)
+        else:
+            status_code = int(headers.pop(":status", 0))
+            future.set_result((status_code, headers, b"".join(chunks)))
+
+    async def _read_frames(self) -> None:
+        error: BaseException = ConnectionResetError("HTTP/2 connection closed")
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                for event in self.conn.receive_data(data):
+                    stream = self._streams.get(getattr(event, "stream_id", None))
+                    if isinstance(event, h2.events.ResponseReceived) and stream:
+                        stream[0].update(
+                            (name.decode("latin-1").lower(), value.decode("latin-1"))
+                            for name, value in event.headers
+                        )
+                    elif isinstance(event, h2.events.DataReceived):
+                        self.conn.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id
+                        )
+                        if stream:
+                            stream[1].append(event.data)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        self._finish(event.stream_id)
+                    elif isinstance(event, h2.events.StreamReset):
+                        self._finish(
+                            event.stream_id,
+                            ConnectionResetError(f"HTTP/2 stream reset ({event.error_code!r})"),
+                        )
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        # GOAWAY: streams past last_stream_id were never processed.
+                        self.closed = True
+                        for stream_id in [
+                            sid for sid in self._streams if sid > (event.last_stream_id or 0)
+                        ]:
+                            self._finish(stream_id, ConnectionResetError("HTTP/2 GOAWAY"))
+                pending = self.conn.data_to_send()
+                if pending:
+                    self.writer.write(pending)
+        except (OSError, h2.exceptions.H2Error) as exc:
+            error = ConnectionResetError(f"HTTP/2 connection failed: {exc!r}")
+        finally:
+            self.closed = True
+            for stream_id in list(self._streams):
+                self._finish(stream_id, error)
+            _close_writer(self.writer)
+
+    def close(self) -> None:
+        self.closed = True
+        self._reader_task.cancel()
+        _close_writer(self.writer)
+
+
+class _ConnectionPool:
+    """Keep-alive connections to a single Riot host.
+
+    HTTP/1.1 connections carry one request at a time; with ``ENABLE_RIOT_HTTP2``
+    the host's requests instead share one ``_H2Connection`` once ALPN agrees on h2.
+    """
+
+    def __init__(self, host: str, port: int, use_tls: bool, maxsize: int) -> None:
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.maxsize = maxsize
+        self.idle: List[_PooledConnection] = []
+        self.stats = {"newConnections": 0, "reusedConnections": 0, "discardedConnections": 0}
+        # None until the first HTTP/2 attempt shows whether the host negotiates h2.
+        self.http2: Optional[bool] = None
+        self.h2: Optional[_H2Connection] = None
+        self._h2_connecting: Optional["asyncio.Future[None]"] = None
+
+    async def acquire(self) -> Tuple[_PooledConnection, bool]:
+        while self.idle:
+            conn = self.idle.pop()
+            if conn.is_usable():
+                self.stats["reusedConnections"] += 1
+                return conn, True
+            self.discard(conn)
+        reader, writer = await _open_riot_connection(self.host, self.port, self.use_tls)
+        self.stats["newConnections"] += 1
+        return _PooledConnection(reader, writer), False
+
+    def release(self, conn: _PooledConnection, reusable: bool) -> None:
+        if reusable and len(self.idle) < self.maxsize and not conn.writer.is_closing():
+            conn.last_used = time.monotonic()
+            self.idle.append(conn)
+        else:
+            self.discard(conn)
+
+    def discard(self, conn: _PooledConnection) -> None:
+        self.stats["discardedConnections"] += 1
+        _close_writer(conn.writer)
+
+    async def acquire_h2(self) -> Tuple[Optional[_H2Connection], bool]:
+        """Return the shared HTTP/2 connection, or ``None`` if the host only speaks HTTP/1.1."""
+        while True:
+            if self.http2 is False:
+                return None, False
+            conn = self.h2
+            if conn is not None and conn.is_usable():
+                reused = conn.streams_opened > 0
+                if reused:
+                    self.stats["reusedConnections"] += 1
+                self.stats["http2Streams"] = self.stats.get("http2Streams", 0) + 1
+                return conn, reused
+            if conn is not None:
+                if not conn._streams:
+                    conn.close()
+                self.h2 = None
+                self.stats["discardedConnections"] += 1
+            if self._h2_connecting is None:
+                self._h2_connecting = asyncio.ensure_future(self._connect_h2())
+            connecting = self._h2_connecting
+            try:
+                # Shielded: concurrent callers share the handshake even if one gives up.
+                await asyncio.shield(connecting)
+            finally:
+                if self._h2_connecting is connecting and connecting.done():
+                    self._h2_connecting = None
+
+    async def _connect_h2(self) -> None:
+        reader, writer = await _open_riot_connection(self.host, self.port, self.use_tls, True)
+        self.stats["newConnections"] += 1
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is None or ssl_object.selected_alpn_protocol() != "h2":
+            # The host picked HTTP/1.1; keep the connection for the regular pool.
+            self.http2 = False
+            self.release(_PooledConnection(reader, writer), True)
+            return
+        self.http2 = True
+        self.h2 = _H2Connection(reader, writer)
+
+
+# Module scope, so warm Lambda invocations keep their connections to each host.
+_connection_pools: Dict[Tuple[str, int, bool], _ConnectionPool] = {}
+
+
+def _get_connection_pool(host: str, port: int, use_tls: bool) -> _ConnectionPool:
+    key = (host, port, use_tls)
+    pool = _connection_pools.get(key)
+    if pool is None:
+        pool = _connection_pools[key] = _ConnectionPool(host, port, use_tls, RIOT_POOL_MAXSIZE)
+    return pool
+
+
+def _connection_pool_stats() -> Dict[str, Dict[str, int]]:
+    return {
+        pool.host: dict(
+            pool.stats,
+            idleConnections=len(pool.idle),
+            protocol="h2" if pool.http2 else "http/1.1",
+        )
+        for pool in _connection_pools.values()
+    }
+
+
+def _has_no_body(status_code: int) -> bool:
+    """1xx, 204 and 304 responses never carry a body (RFC 9112, section 6.3)."""
+    return 100 <= status_code < 200 or status_code in (204, 304)
+
+
+async def _read_http_response(
+    reader: asyncio.StreamReader,
+) -> Tuple[int, Dict[str, str], bytes]:
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response status line")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise ConnectionError(f"Malformed HTTP status line: {status_line[:80]!r}")
+        status_code = int(parts[1])
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            key = name.strip().lower()
+            headers[key] = f"{headers[key]}, {value.strip()}" if key in headers else value.strip()
+        # Interim responses (100 Continue, 103 Early Hints) precede the real one.
+        if not 100 <= status_code < 200:
+            break
+
+    if _has_no_body(status_code):
+        body = b""
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks: List[bytes] = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+    return status_code, headers, body
+
+
+async def _http_get_async(
+    url: str,
+    *,
+    headers: Dict[str, str],
+    params: Optional[Dict[str, Any]] = None,
+    timeout: float = 15,
+) -> Tuple[int, Dict[str, str], bytes]:
+    parsed = urlsplit(url)
+    use_tls = parsed.scheme == "https"
+    host = parsed.hostname or ""
+    port = parsed.port or (443 if use_tls else 80)
+    # Like requests, ``params`` are appended to any query already in the URL.
+    query = "&".join(
+        part for part in (parsed.query, urlencode(params or {}, doseq=True)) if part
+    )
+    target = f"{parsed.path or '/'}{'?' + query if query else ''}"
+
+    request_lines = [f"GET {target} HTTP/1.1", f"Host: {parsed.netloc}"]
+    request_lines.extend(f"{name}: {value}" for name, value in headers.items())
+    request_lines.extend(
+        [
+            "Accept: application/json",
+            "Accept-Encoding: gzip, deflate",
+            "Connection: keep-alive",
+            "",
+            "",
+        ]
+    )
+    request_bytes = "\r\n".join(request_lines).encode("latin-1")
+    pool = _get_connection_pool(host, port, use_tls)
+
+    async def _exchange() -> Tuple[int, Dict[str, str], bytes]:
+        while True:
+            conn, reused = await pool.acquire()
+            try:
+                conn.writer.write(request_bytes)
+                await conn.writer.drain()
+                status_code, response_headers, body = await _read_http_response(conn.reader)
+            except (OSError, asyncio.IncompleteReadError):
+                pool.discard(conn)
+                if reused:
+                    continue  # the server dropped an idle keep-alive connection
+                raise
+            except BaseException:
+                pool.discard(conn)
+                raise
+            reusable = response_headers.get("connection", "").lower() != "close" and (
+                _has_no_body(status_code)
+                or "content-length" in response_headers
+                or response_headers.get("transfer-encoding", "").lower() == "chunked"
+            )
+            pool.release(conn, reusable)
+            return status_code, response_headers, body
+
+    async def _exchange_h2() -> Tuple[int, Dict[str, str], bytes]:
+        h2_headers = [
+            (":method", "GET"),
+            (":scheme", parsed.scheme),
+            (":authority", parsed.netloc),
+            (":path", target),
+            *((name.lower(), value) for name, value in headers.items()),
+            ("accept", "application/json"),
+            ("accept-encoding", "gzip, deflate"),
+        ]
+        while True:
+            conn, reused = await pool.acquire_h2()
+            if conn is None:
+                return await _exchange()
+            try:
+                return await conn.request(h2_headers)
+            except (OSError, h2.exceptions.H2Error) as exc:
+                if reused and conn.closed and not isinstance(exc, h2.exceptions.H2Error):
+                    continue  # GOAWAY or a dropped idle connection; open a fresh one
+                raise ConnectionResetError(f"HTTP/2 request failed: {exc!r}") from exc
+
+    use_h2 = ENABLE_RIOT_HTTP2 and h2 is not None and use_tls
+    try:
+        status_code, response_headers, body = await asyncio.wait_for(
+            _exchange_h2() if use_h2 else _exchange(), timeout
+        )
+        return status_code, response_headers, _decode_content(response_headers, body)
+    except asyncio.TimeoutError as exc:
+        raise requests.exceptions.Timeout(f"Timed out after {timeout}s waiting on {url}") from exc
+    except (OSError, EOFError, asyncio.IncompleteReadError, ValueError, zlib.error) as exc:
+        raise requests.exceptions.ConnectionError(f"Connection to {host} failed: {exc!r}") from exc
+
+
+# ---------- Riot rate limiting ----------
+_RIOT_METHODS = (
+    (re.compile(r"^/riot/account/v1/accounts/by-riot-id/"), "account-v1.getByRiotId"),
+    (re.compile(r"^/lol/match/v5/matches/by-puuid/[^/]+/ids$"), "match-v5.getMatchIdsByPUUID"),
+    (re.compile(r"^/lol/match/v5/matches/[^/]+$"), "match-v5.getMatch"),
+    (re.compile(r"^/lol/summoner/v4/summoners/by-puuid/"), "summoner-v4.getByPUUID"),
+    (re.compile(r"^/lol/league/v4/entries/by-summoner/"), "league-v4.getLeagueEntriesForSummoner"),
+    (re.compile(r"^/lol/status/v4/platform-data$"), "lol-status-v4.getPlatformData"),
+)
+
+
+def _riot_endpoint(url: str) -> Tuple[str, str]:
+    """Return ``(host, method)`` - the scopes Riot applies app and method limits to."""
+    parsed = urlsplit(url)
+    path = parsed.path or "/"
+    method = next((name for pattern, name in _RIOT_METHODS if pattern.match(path)), path)
+    return parsed.hostname or "", method
+
+
+def _parse_rate_limits(raw: Optional[str]) -> List[Tuple[int, int]]:
+    """Parse ``"20:1,100:120"`` style headers into ``[(20, 1), (100, 120)]``."""
+    pairs: List[Tuple[int, int]] = []
+    for chunk in (raw or "").split(","):
+        first, _, second = chunk.strip().partition(":")
+        try:
+            pairs.append((int(first), int(second)))
+        except ValueError:
+            continue
+    return pairs
+
+
+class _RateLimitWindow:
+    """Tracks one Riot limit of ``limit`` requests per ``window`` seconds.
+
+    Send times are kept in a sliding log and only ``RIOT_RATE_LIMIT_HEADROOM`` of the
+    limit may sit in it at once. Any window that holds no more than that also
+    satisfies Riot's fixed windows, wherever they happen to start. Counts reported
+    by Riot, which include other containers sharing the key, top the log up.
+    """
+
+    def __init__(self, limit: int, window: int) -> None:
+        self.limit = limit
+        self.window = max(1, window)
+        self.allowance = max(1, int(limit * RIOT_RATE_LIMIT_HEADROOM))
+        self.sent: Deque[float] = deque()
+
+    def _expire(self, now: float) -> None:
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+
+    def wait_time(self, now: float) -> float:
+        self._expire(now)
+        if len(self.sent) < self.allowance:
+            return 0.0
+        return self.sent[len(self.sent) - self.allowance] + self.window - now
+
+    def consume(self, now: float) -> None:
+        self.sent.append(now)
+
+    def spare(self, now: float) -> int:
+        self._expire(now)
+        return self.allowance - len(self.sent)
+
+    def observe_count(self, count: int, sent_at: float) -> None:
+        self._expire(time.monotonic())
+        missing = count - sum(1 for stamp in self.sent if stamp <= sent_at)
+        for _ in range(max(0, missing)):
+            # Requests we did not send; age them out alongside ours.
+            self.sent.appendleft(sent_at)
+        if missing > 0:
+            self.sent = deque(sorted(self.sent))
+
+
+class _RateLimitScheduler:
+    """Per-host app limits and per-(host, method) limits, synced from Riot headers."""
+
+    def __init__(self) -> None:
+        self.windows: Dict[Tuple[str, ...], List[_RateLimitWindow]] = {}
+        self.blocked_until: Dict[Tuple[str, ...], float] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def _host_stats(self, host: str) -> Dict[str, Any]:
+        return self.stats.setdefault(host, {"waits": 0, "waitedSeconds": 0.0, "throttled": 0})
+
+    def _scopes(self, host: str, method: str) -> List[Tuple[str, ...]]:
+        app_scope = ("app", host)
+        if app_scope not in self.windows:
+            self._set_limits(app_scope, _parse_rate_limits(RIOT_APP_RATE_LIMIT))
+        return [app_scope, ("method", host, method)]
+
+    def _set_limits(self, scope: Tuple[str, ...], limits: List[Tuple[int, int]]) -> None:
+        current = [(window.limit, window.window) for window in self.windows.get(scope, [])]
+        if limits and limits != current:
+            self.windows[scope] = [_RateLimitWindow(limit, window) for limit, window in limits]
+
+    async def acquire(self, host: str, method: str) -> float:
+        """Wait until every limit covering this call has room; returns the send time."""
+        scopes = self._scopes(host, method)
+        while True:
+            now = time.monotonic()
+            windows = [window for scope in scopes for window in self.windows.get(scope, [])]
+            delay = max(
+                [window.wait_time(now) for window in windows]
+                + [self.blocked_until.get(scope, 0.0) - now for scope in scopes]
+            )
+            if delay <= 0:
+                for window in windows:
+                    window.consume(now)
+                return now
+            stats = self._host_stats(host)
+            stats["waits"] += 1
+            stats["waitedSeconds"] = round(stats["waitedSeconds"] + delay, 3)
+            await asyncio.sleep(delay)
+
+    def observe(
+        self,
+        host: str,
+        method: str,
+        sent_at: float,
+        status_code: int,
+        headers: Dict[str, str],
+    ) -> None:
+        now = time.monotonic()
+        app_scope, method_scope = self._scopes(host, method)
+        for scope, prefix in ((app_scope, "x-app-rate-limit"), (method_scope, "x-method-rate-limit")):
+            self._set_limits(scope, _parse_rate_limits(headers.get(prefix)))
+            counts = {
+                seconds: count
+                for count, seconds in _parse_rate_limits(headers.get(f"{prefix}-count"))
+            }
+            for window in self.windows.get(scope, []):
+                if window.window in counts:
+                    window.observe_count(counts[window.window], sent_at)
+
+        if status_code == 429:
+            self._host_stats(host)["throttled"] += 1
+            try:
+                retry_after = float(headers.get("retry-after") or 1)
+            except ValueError:
+                retry_after = 1.0
+            limit_type = headers.get("x-rate-limit-type", "").lower()
+            scope = app_scope if limit_type == "application" else method_scope
+            self.blocked_until[scope] = max(self.blocked_until.get(scope, 0.0), now + retry_after)
+
+    def spare_capacity(self, host: str, method: str) -> int:
+        """Requests that could be sent right now without waiting on any limit."""
+        now = time.monotonic()
+        scopes = self._scopes(host, method)
+        if any(self.blocked_until.get(scope, 0.0) > now for scope in scopes):
+            return 0
+        spare = [window.spare(now) for scope in scopes for window in self.windows.get(scope, [])]
+        # Method limits are unknown until Riot's first response reports them.
+        return max(0, min(spare)) if spare else 0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        snapshot: Dict[str, Dict[str, Any]] = {}
+        for scope, windows in self.windows.items():
+            host_entry = snapshot.setdefault(
+                scope[1], {"methods": {}, **self._host_stats(scope[1])}
+            )
+            limits = ",".join(f"{window.limit}:{window.window}" for window in windows)
+            if scope[0] == "app":
+                host_entry["app"] = limits
+            else:
+                host_entry["methods"][scope[2]] = limits
+        return snapshot
+
+
+_rate_limiter = _RateLimitScheduler()
+
+
+# ---------- Invocation deadline ----------
+# Monotonic time by which the current invocation must have its answer ready.
+_invocation_deadline: ContextVar[Optional[float]] = ContextVar("invocation_deadline", default=None)
+
+
+def _deadline_from_context(context: Any) -> Optional[float]:
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if not callable(get_remaining):
+        return None
+    try:
+        remaining_ms = float(get_remaining())
+    except (TypeError, ValueError):
+        return None
+    return time.monotonic() + (remaining_ms - LAMBDA_DEADLINE_MARGIN_MS) / 1000
+
+
+def _time_remaining() -> Optional[float]:
+    deadline = _invocation_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class RiotDeadlineExceeded(RuntimeError):
+    """The invocation deadline arrived before a Riot call could complete."""
+
+
+# ---------- Circuit breakers ----------
+class RiotCircuitOpen(RuntimeError):
+    """A Riot host/endpoint family is failing; the call was refused without being sent."""
+
+
+class _CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open after a cooldown.
+
+    While open every call fails fast. Half-open lets one probe through; its
+    outcome closes the circuit again or restarts the cooldown.
+    """
+
+    def __init__(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self.stats: Counter = Counter()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= RIOT_BREAKER_COOLDOWN_SECONDS:
+            self.state = "half-open"
+            self.probe_started = None
+        if self.state == "closed":
+            return True
+        if self.state == "half-open" and (
+            # A probe that never reported back (cancelled, deadline) frees its slot.
+            self.probe_started is None
+            or now - self.probe_started >= RIOT_BREAKER_COOLDOWN_SECONDS
+        ):
+            self.probe_started = now
+            self.stats["probes"] += 1
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.probe_started = None
+
+    def release(self) -> None:
+        """Forget a call that said nothing about the host (it ran out of our time)."""
+        if self.state == "half-open":
+            self.probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= RIOT_BREAKER_FAILURE_THRESHOLD:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, state=self.state, consecutiveFailures=self.failures)
+
+
+# (host, endpoint family) -> breaker; the family is the API name, e.g. "summoner-v4".
+_circuit_breakers: Dict[Tuple[str, str], _CircuitBreaker] = {}
+
+# Endpoints whose last good response may stand in while their circuit is open or
+# the call fails transiently. Everything the recap builds from them is best-effort.
+_LAST_GOOD_METHODS = {
+    "summoner-v4.getByPUUID",
+    "league-v4.getLeagueEntriesForSummoner",
+    "lol-status-v4.getPlatformData",
+}
+_last_known_good = _LRUCache(RIOT_LAST_GOOD_CACHE_SIZE, ttl_seconds=RIOT_LAST_GOOD_TTL_SECONDS)
+
+
+def _get_circuit_breaker(host: str, method: str) -> _CircuitBreaker:
+    key = (host, method.partition(".")[0])
+    breaker = _circuit_breakers.get(key)
+    if breaker is None:
+        breaker = _circuit_breakers[key] = _CircuitBreaker()
+    return breaker
+
+
+def _circuit_breaker_snapshot() -> Dict[str, Dict[str, Any]]:
+    snapshot: Dict[str, Dict[str, Any]] = {}
+    for (host, family), breaker in _circuit_breakers.items():
+        snapshot.setdefault(host, {})[family] = breaker.snapshot()
+    return snapshot
+
+
+# ---------- Riot retries ----------
+class RiotApiError(RuntimeError):
+    """Non-200 response from Riot; still a ``RuntimeError`` for existing handlers."""
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Retries per endpoint, capped by RIOT_MAX_RETRIES. Calls the recap cannot do
+# without get more attempts than ones it can degrade around.
+_RIOT_RETRY_CAPS = {
+    "account-v1.getByRiotId": 3,
+    "match-v5.getMatchIdsByPUUID": 3,
+    "match-v5.getMatch": 2,
+    "summoner-v4.getByPUUID": 2,
+    "league-v4.getLeagueEntriesForSummoner": 2,
+    "lol-status-v4.getPlatformData": 1,
+}
+
+_retry_stats: Dict[str, Counter] = {}
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """Honor ``Retry-After`` when Riot sends it, else use full-jitter backoff."""
+    try:
+        if retry_after is not None:
+            return float(retry_after) + random.uniform(0, RIOT_RETRY_BASE_SECONDS)
+    except ValueError:
+        pass
+    ceiling = min(RIOT_RETRY_MAX_SECONDS, RIOT_RETRY_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+async def _riot_request_json_async(
     url: str,
     *,
     params: Optional[Dict[str, Any]] = None,
     timeout: int = 15,
+    decode: Optional[Callable[[bytes], Any]] = None,
 ) -> Dict[str, Any]:
-    response = requests.get(url, headers=_riot_headers(), params=params, timeout=timeout)
-    if response.status_code != 200:
-        raise RuntimeError(
-            f"Riot API error {response.status_code} for {url} :: {response.text[:200]}"
+    host, method = _riot_endpoint(url)
+    max_retries = min(RIOT_MAX_RETRIES, _RIOT_RETRY_CAPS.get(method, RIOT_MAX_RETRIES))
+    stats = _retry_stats.setdefault(method, Counter())
+    breaker = _get_circuit_breaker(host, method)
+    cache_key = (url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+    budget_end = time.monotonic() + RIOT_REQUEST_BUDGET_SECONDS
+    deadline = _invocation_deadline.get()
+    if deadline is not None and deadline < budget_end:
+        budget_end = deadline
+    else:
+        deadline = None
+    attempt = 0
+
+    def _deadline_error() -> RiotDeadlineExceeded:
+        stats["deadlineExceeded"] += 1
+        return RiotDeadlineExceeded(f"Invocation deadline reached before {method} on {host}")
+
+    def _last_good_or(error: Exception) -> Dict[str, Any]:
+        cached = _last_known_good.get(cache_key) if method in _LAST_GOOD_METHODS else None
+        if cached is None:
+            raise error
+        breaker.stats["servedLastGood"] += 1
+        print(f"♻️ Serving last good {method} for {host} after {error!r:.120}")
+        return cached
+
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise _deadline_error()
+        if not breaker.allow():
+            return _last_good_or(
+                RiotCircuitOpen(f"Circuit open for {method.partition('.')[0]} on {host}")
+            )
+        try:
+            sent_at = await asyncio.wait_for(
+                _rate_limiter.acquire(host, method), budget_end - time.monotonic()
+            )
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                raise _deadline_error() from None
+            stats["budgetExhausted"] += 1
+            raise RuntimeError(f"Riot rate limit budget exhausted for {url}") from None
+
+        retry_after: Optional[str] = None
+        call_timeout = max(0.1, min(timeout, budget_end - time.monotonic()))
+        try:
+            status_code, response_headers, body = await _http_get_async(
+                url,
+                headers=_riot_headers(),
+                params=params,
+                timeout=call_timeout,
+            )
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as exc:
+            error: Exception = exc
+            if isinstance(exc, requests.exceptions.Timeout) and call_timeout < timeout:
+                # Cut short by our own deadline or budget, not a slow host: the
+                # breaker only counts calls that had the full per-call timeout.
+                breaker.release()
+                if deadline is not None:
+                    raise _deadline_error() from exc
+            else:
+                breaker.record_failure()
+        else:
+            _rate_limiter.observe(host, method, sent_at, status_code, response_headers)
+            if status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if status_code == 200:
+                try:
+                    data = (decode or _json_loads)(body)
+                except ValueError as exc:  # pragma: no cover - defensive
+                    raise RuntimeError(f"Invalid JSON from Riot API for {url}") from exc
+                if method in _LAST_GOOD_METHODS:
+                    _last_known_good.set(cache_key, data)
+                return data
+            error = RiotApiError(
+                f"Riot API error {status_code} for {url} :: "
+                f"{body[:200].decode('utf-8', errors='replace')}",
+                status_code,
+            )
+            if status_code not in _RETRYABLE_STATUS_CODES:
+                raise error
+            retry_after = response_headers.get("retry-after")
+
+        delay = _retry_delay(attempt, retry_after)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise _deadline_error() from error
+        if (
+            attempt >= max_retries
+            or time.monotonic() + delay >= budget_end
+            or breaker.state == "open"
+        ):
+            stats["gaveUp"] += 1
+            return _last_good_or(error)
+        attempt += 1
+        stats["retries"] += 1
+        print(f"⏳ Retrying {method} on {host} in {delay:.2f}s after {error!r:.120}")
+        await asyncio.sleep(delay)
+
+
+# ---------- Request coalescing ----------
+# (loop, url, params) -> [shared task, number of callers awaiting it]
+_inflight_requests: Dict[Tuple[Any, ...], List[Any]] = {}
+_coalescing_stats: Counter = Counter()
+
+
+async def _riot_get_json_async(
+    url: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: int = 15,
+    coalesce: bool = True,
+    decode: Optional[Callable[[bytes], Any]] = None,
+) -> Dict[str, Any]:
+    """Fetch Riot JSON, sharing one in-flight request between identical callers.
+
+    Concurrent calls for the same URL and params await a single request and get
+    the same parsed object back, so callers must treat results as read-only.
+    ``decode`` replaces the JSON codec; only callers with equal decoders share.
+    """
+    if not coalesce:
+        return await _riot_request_json_async(url, params=params, timeout=timeout, decode=decode)
+
+    key = (
+        asyncio.get_running_loop(),
+        url,
+        tuple(sorted((str(name), str(value)) for name, value in (params or {}).items())),
+        decode,
+    )
+    entry = _inflight_requests.get(key)
+    leader = entry is None
+    if leader:
+        task = asyncio.ensure_future(
+            _riot_request_json_async(url, params=params, timeout=timeout, decode=decode)
+        )
+        entry = _inflight_requests[key] = [task, 0]
+        task.add_done_callback(
+            lambda _, entry=entry: _inflight_requests.pop(key, None)
+            if _inflight_requests.get(key) is entry
+            else None
         )
+        _coalescing_stats["requests"] += 1
+    else:
+        _coalescing_stats["coalesced"] += 1
+
+    task = entry[0]
+    entry[1] += 1
     try:
-        return response.json()
-    except ValueError as exc:  # pragma: no cover - defensive
-        raise RuntimeError(f"Invalid JSON from Riot API for {url}") from exc
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Only drop the shared request once nobody is waiting on it any more.
+        if entry[1] == 1 and not task.done():
+            task.cancel()
+        raise
+    except RiotDeadlineExceeded:
+        # The shared request ran under the first caller's deadline, not ours.
+        remaining = _time_remaining()
+        if leader or (remaining is not None and remaining <= 0):
+            raise
+        return await _riot_request_json_async(url, params=params, timeout=timeout, decode=decode)
+    finally:
+        entry[1] -= 1
+
+
+def _riot_get_json(
+    url: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: int = 15,
+) -> Dict[str, Any]:
+    """Blocking wrapper for callers outside an event loop."""
+    return _run_coroutine(_riot_get_json_async(url, params=params, timeout=timeout))
 
 
 def _extract_match_entry(match_json: Dict[str, Any], puuid: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
@@ -211,6 +1837,416 @@ def _extract_match_entry(match_json: Dict[str, Any], puuid: str) -> Tuple[Option
     return entry, info.get("platformId")
 
 
+# ---------- Projected match parsing ----------
+# Everything _extract_match_entry reads. Other participants only need what the
+# team kill totals use; every other object in the payload is dropped as parsed.
+_MATCH_INFO_FIELDS = frozenset(
+    {"gameId", "gameDuration", "gameLength", "platformId", "queueId", "participants"}
+)
+_MATCH_PLAYER_FIELDS = frozenset(
+    {
+        "puuid", "teamId", "championName", "teamPosition", "individualPosition", "win",
+        "kills", "deaths", "assists", "totalMinionsKilled", "neutralMinionsKilled",
+        "goldEarned", "totalDamageDealtToChampions", "damageDealtToObjectives",
+        "visionScore", "pentaKills", "largestMultiKill",
+    }
+)
+_MATCH_ALLY_FIELDS = frozenset({"puuid", "teamId", "kills"})
+
+
+class _MatchProjection:
+    """Decode a match-v5 detail keeping only what one player's recap entry needs.
+
+    The nine other participants shrink to three keys and nested blocks
+    (challenges, perks, missions, teams) are dropped. With orjson the whole
+    document is parsed natively and then trimmed, which is far cheaper than any
+    Python-level hook. With the stdlib codec a ``object_pairs_hook`` trims each
+    object as soon as it is parsed, so the full document is never held at once.
+    Equal for the same puuid, so identical in-flight fetches can still be coalesced.
+    """
+
+    __slots__ = ("puuid",)
+
+    def __init__(self, puuid: str) -> None:
+        self.puuid = puuid
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _MatchProjection) and other.puuid == self.puuid
+
+    def __hash__(self) -> int:
+        return hash((_MatchProjection, self.puuid))
+
+    def _object(self, pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        # Objects arrive innermost first, so they are told apart by their keys.
+        # Anything unrecognised (challenges, perks, ...) shrinks to an empty dict.
+        obj = dict(pairs)
+        if "puuid" in obj:
+            return self._participant(obj)
+        if "metadata" in obj or "info" in obj:
+            return obj
+        if "matchId" in obj or "dataVersion" in obj:
+            return self._metadata(obj)
+        if not _MATCH_INFO_FIELDS.isdisjoint(obj):
+            return {key: obj[key] for key in _MATCH_INFO_FIELDS if key in obj}
+        return {}
+
+    def _participant(self, obj: Any) -> Dict[str, Any]:
+        if not isinstance(obj, dict) or "puuid" not in obj:
+            return {}
+        fields = _MATCH_PLAYER_FIELDS if obj["puuid"] == self.puuid else _MATCH_ALLY_FIELDS
+        return {key: obj[key] for key in fields if key in obj}
+
+    @staticmethod
+    def _metadata(obj: Dict[str, Any]) -> Dict[str, Any]:
+        return {"matchId": obj["matchId"]} if "matchId" in obj else {}
+
+    def project(self, match: Any) -> Dict[str, Any]:
+        """Trim an already-parsed match to what ``_object`` would have kept."""
+        if not isinstance(match, dict):
+            return {}
+        projected: Dict[str, Any] = {}
+        metadata = match.get("metadata")
+        if isinstance(metadata, dict):
+            projected["metadata"] = self._metadata(metadata)
+        info = match.get("info")
+        if isinstance(info, dict):
+            projected["info"] = {key: info[key] for key in _MATCH_INFO_FIELDS if key in info}
+            if isinstance(info.get("participants"), list):
+                projected["info"]["participants"] = [
+                    self._participant(participant) for participant in info["participants"]
+                ]
+        return projected
+
+    def parse_with_hook(self, body: bytes) -> Dict[str, Any]:
+        return json.loads(body.decode("utf-8"), object_pairs_hook=self._object) or {}
+
+    def __call__(self, body: bytes) -> Dict[str, Any]:
+        if _json_codec_name == "orjson":
+            return self.project(_json_loads(body))
+        return self.parse_with_hook(body)
+
+
+def _raw_body(body: bytes) -> bytes:
+    """Decoder that keeps the response bytes, so they can be cached before parsing."""
+    return body
+
+
+# ---------- Match-detail hedging ----------
+_match_detail_latencies: Deque[float] = deque(maxlen=200)
+_hedge_stats: Counter = Counter()
+
+
+def _hedge_delay() -> Optional[float]:
+    if not ENABLE_MATCH_HEDGING or len(_match_detail_latencies) < MATCH_HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_match_detail_latencies)
+    return ordered[min(len(ordered) - 1, len(ordered) * MATCH_HEDGE_PERCENTILE // 100)]
+
+
+async def _timed_match_detail(
+    detail_url: str,
+    *,
+    coalesce: bool = True,
+    decode: Optional[Callable[[bytes], Any]] = None,
+) -> Dict[str, Any]:
+    started = time.monotonic()
+    detail_json = await _riot_get_json_async(detail_url, coalesce=coalesce, decode=decode)
+    _match_detail_latencies.append(time.monotonic() - started)
+    return detail_json
+
+
+async def _get_match_detail(
+    detail_url: str, decode: Optional[Callable[[bytes], Any]] = None
+) -> Dict[str, Any]:
+    """Fetch one match detail, hedging it when it runs past the latency percentile.
+
+    A hedge is only sent when the rate limiter has room to spare for it, so it
+    never pushes the app or method budget into 429s.
+    """
+    delay = _hedge_delay()
+    primary = asyncio.ensure_future(_timed_match_detail(detail_url, decode=decode))
+    if delay is None:
+        return await primary
+
+    hedge: Optional["asyncio.Future[Any]"] = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        host, method = _riot_endpoint(detail_url)
+        # Keep one request's worth of room for the regular fetches.
+        if done or _rate_limiter.spare_capacity(host, method) < 2:
+            if not done:
+                _hedge_stats["skippedForBudget"] += 1
+            return await primary
+
+        _hedge_stats["hedged"] += 1
+        hedge = asyncio.ensure_future(
+            _timed_match_detail(detail_url, coalesce=False, decode=decode)
+        )
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    if task is hedge:
+                        _hedge_stats["hedgeWon"] += 1
+                    return task.result()
+        return primary.result()  # both failed; surface the primary's error
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+class _MatchUnavailable(RuntimeError):
+    """Riot has no usable details for a match (404 or unparsable JSON); retrying won't help."""
+
+
+async def _fetch_match_entry(
+    routing: str, match_id: str, puuid: str
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    cached = _match_entries.get((match_id, puuid))
+    if cached is not None:
+        return cached
+
+    raw = await _match_detail_cache.get(match_id)
+    fetched = raw is None
+    if fetched:
+        if f"match:{match_id}" in _negative_cache:
+            raise _MatchUnavailable(f"Match {match_id} was recently unavailable; not retrying yet")
+        detail_url = f"https://{routing}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+        try:
+            raw = await _get_match_detail(detail_url, _raw_body)
+        except RiotApiError as exc:
+            if exc.status_code != 404:
+                raise
+            _negative_cache.add(f"match:{match_id}")
+            raise _MatchUnavailable(str(exc)) from exc
+    decode = _MatchProjection(puuid) if MATCH_DETAIL_PARSE_MODE == "projected" else _json_loads
+    try:
+        match_json = decode(raw)
+    except ValueError as exc:
+        _negative_cache.add(f"match:{match_id}")
+        raise _MatchUnavailable(f"Invalid JSON in match details for {match_id}") from exc
+    if fetched:
+        _match_detail_cache.set(match_id, raw)
+    result = _extract_match_entry(match_json, puuid)
+    _match_entries.set((match_id, puuid), result)
+    return result
+
+
+class _MatchIdStream:
+    """Match IDs for one player, paged through ``start``/``count``.
+
+    The next page is requested as soon as the previous one arrives, so it
+    downloads while that page's details do. IDs are dropped once handed out;
+    only the first ``keep`` are remembered for the response.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        *,
+        total: int,
+        page_size: int = MATCH_ID_PAGE_SIZE,
+        keep: int = 0,
+    ) -> None:
+        self.url = url
+        self.params = params
+        self.total = total
+        self.page_size = page_size
+        self.keep = keep
+        self.head: List[str] = []
+        self.fetched = 0
+        self.pages = 0
+        self.exhausted = False
+        # Set when a later page failed, so the history may stop short of ``total``.
+        self.truncated = False
+        self.page: Optional["asyncio.Future[List[str]]"] = None
+        self._requested = 0
+        self._buffer: Deque[str] = deque()
+
+    @classmethod
+    def from_ids(cls, ids: List[str], *, keep: int = 0, pages: int = 0) -> "_MatchIdStream":
+        """A stream over IDs already in hand; it never calls Riot."""
+        stream = cls("", {}, total=len(ids), keep=keep)
+        stream.head = ids[:keep]
+        stream.fetched = len(ids)
+        stream.pages = pages
+        stream.exhausted = True
+        stream._buffer.extend(ids)
+        return stream
+
+    async def start(self) -> "_MatchIdStream":
+        """Fetch the first page; errors here propagate like any other Riot call."""
+        self._request_page()
+        await self.page
+        self.take_page()
+        return self
+
+    def _request_page(self) -> None:
+        count = min(self.page_size, self.total - self.fetched)
+        params = {**self.params, "count": count}
+        if self.fetched:
+            params["start"] = self.fetched
+        self._requested = count
+        self.page = asyncio.ensure_future(_riot_get_json_async(self.url, params=params))
+
+    def take_page(self) -> None:
+        """Move a finished page into the buffer and prefetch the one after it."""
+        page, self.page = self.page, None
+        try:
+            ids = page.result() or []
+        except (RuntimeError, requests.RequestException) as exc:
+            if not self.pages:
+                raise
+            # Later pages only extend the history; keep what we already have.
+            print(f"⚠️ Match-ID page at {self.fetched} failed: {exc!r:.120}")
+            self.truncated = True
+            self.pages += 1
+            self.exhausted = True
+            return
+        self.pages += 1
+        self.fetched += len(ids)
+        if len(self.head) < self.keep:
+            self.head.extend(ids[: self.keep - len(self.head)])
+        self._buffer.extend(ids)
+        if len(ids) < self._requested or self.fetched >= self.total:
+            self.exhausted = True
+        else:
+            self._request_page()
+
+    def pop(self) -> Optional[str]:
+        return self._buffer.popleft() if self._buffer else None
+
+    @property
+    def drained(self) -> bool:
+        return self.exhausted and not self._buffer
+
+    def close(self) -> None:
+        if self.page is not None:
+            self.page.cancel()
+            self.page = None
+        self.exhausted = True
+
+
+async def _fetch_match_entries(
+    routing: str,
+    match_ids: _MatchIdStream,
+    puuid: str,
+    *,
+    limit: int,
+    workers: int,
+) -> Tuple[List[Dict[str, Any]], Optional[str], bool, List[str]]:
+    """Fetch match details with at most ``workers`` requests in flight.
+
+    IDs are pulled from ``match_ids`` as fetch slots free up, so later pages
+    stream in while earlier details download. Results are consumed in ID
+    order, so the returned entries keep the newest-first ordering and match
+    what a sequential walk would have produced. Once ``limit`` usable entries
+    exist, outstanding fetches (and page prefetches) are cancelled.
+
+    When the invocation deadline gets within the reserve (``DETAIL_FETCH_RESERVE_MS``,
+    capped at a third of the time left on entry), no new fetches start; whatever
+    has already arrived is returned (still newest-first) and the third value is
+    set to mark the result as partial. The reserve only applies once a usable
+    entry exists, since a recap with none is a failure anyway.
+
+    The last value lists match IDs inside the returned window whose details
+    failed in a way a later request could fix (5xx, open circuit, transport
+    errors); matches Riot has no details for are skipped without being listed.
+    """
+    entries: List[Dict[str, Any]] = []
+    platform_host: Optional[str] = None
+    failed_ids: List[str] = []
+    if limit <= 0 or match_ids.drained:
+        match_ids.close()
+        return entries, platform_host, False, failed_ids
+
+    # index -> (entry, platform_id), or None when the fetch failed.
+    results: Dict[int, Optional[Tuple[Optional[Dict[str, Any]], Optional[str]]]] = {}
+    # index -> match ID for fetches that failed but may succeed on a later request.
+    retryable: Dict[int, str] = {}
+    pending: Dict["asyncio.Task[Any]", Tuple[int, str]] = {}
+    next_index = cursor = 0
+    remaining = _time_remaining()
+    reserve = 0.0 if remaining is None else min(DETAIL_FETCH_RESERVE_MS / 1000, remaining / 3)
+    partial = False
+
+    def _accept(result: Optional[Tuple[Optional[Dict[str, Any]], Optional[str]]]) -> None:
+        nonlocal platform_host
+        if not result or not result[0]:
+            return
+        entry, platform_id = result
+        entries.append(entry)
+        if not platform_host and platform_id:
+            platform_host = platform_id.lower()
+
+    try:
+        while len(entries) < limit and (cursor < next_index or not match_ids.drained):
+            remaining = _time_remaining()
+            # Usable results that finished out of order still count towards the
+            # limit, so don't start fetches that can no longer be needed.
+            buffered = sum(1 for result in results.values() if result and result[0])
+            hold_back = reserve if entries or buffered else 0.0
+            if remaining is not None and remaining <= hold_back:
+                partial = True
+                break
+            needed = limit - len(entries) - buffered
+            while len(pending) < max(1, min(workers, needed)):
+                match_id = match_ids.pop()
+                if match_id is None:
+                    break
+                task = asyncio.ensure_future(_fetch_match_entry(routing, match_id, puuid))
+                pending[task] = (next_index, match_id)
+                next_index += 1
+
+            if cursor not in results:
+                waiting: List["asyncio.Future[Any]"] = list(pending)
+                if match_ids.page is not None and len(pending) < workers:
+                    waiting.append(match_ids.page)
+                done, _ = await asyncio.wait(
+                    waiting,
+                    timeout=None if remaining is None else remaining - hold_back,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task is match_ids.page:
+                        match_ids.take_page()
+                        continue
+                    index, match_id = pending.pop(task)
+                    try:
+                        results[index] = task.result()
+                    except _MatchUnavailable:
+                        results[index] = None
+                    except (RuntimeError, requests.RequestException):
+                        results[index] = None
+                        retryable[index] = match_id
+
+            while cursor in results and len(entries) < limit:
+                _accept(results.pop(cursor))
+                if cursor in retryable:
+                    failed_ids.append(retryable[cursor])
+                cursor += 1
+
+        if partial:
+            # Keep details that finished out of order rather than dropping them.
+            for index in sorted(results):
+                if len(entries) >= limit:
+                    break
+                _accept(results[index])
+                if index in retryable:
+                    failed_ids.append(retryable[index])
+    finally:
+        match_ids.close()
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return entries, platform_host, partial, failed_ids
+
+
 def _build_recap_payload(
     summoner_label: str,
     region_label: str,
@@ -708,6 +2744,18 @@ def _normalize_prompt_style(raw_style: Optional[str]) -> str:
     return mapping.get(key, DEFAULT_FEEDBACK_TONE)
 
 
+def _ai_feedback_cache_key(stats_context: Dict[str, Any], tone_key: str) -> str:
+    """Stable digest of the normalized stats context, tone and model."""
+    normalized = json.dumps(
+        stats_context, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    digest = hashlib.sha256()
+    for part in (BEDROCK_MODEL_ID, tone_key, normalized):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
 def _generate_ai_feedback(stats_context: Dict[str, Any], prompt_style: Optional[str] = None) -> Dict[str, Any]:
     """Generate AI feedback using Amazon Bedrock (supports Anthropic + AI21)."""
 
@@ -779,9 +2827,214 @@ def _generate_ai_feedback(stats_context: Dict[str, Any], prompt_style: Optional[
         return {"message": "", "modelId": BEDROCK_MODEL_ID, "error": str(e)}
 
 
+async def _get_ai_feedback(
+    stats_context: Dict[str, Any], prompt_style: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run ``_generate_ai_feedback`` in a worker thread, behind the feedback cache.
+
+    The cache is not thread-safe, so it is only read and written here on the
+    event loop; only successful messages are stored.
+    """
+    cache_key = None
+    if ENABLE_BEDROCK and stats_context:
+        cache_key = _ai_feedback_cache_key(stats_context, _normalize_prompt_style(prompt_style))
+        cached = _ai_feedback_cache.get(cache_key)
+        if cached is not None:
+            print("♻️ Returning cached AI feedback")
+            return dict(cached, cached=True)
+
+    feedback = await asyncio.to_thread(_generate_ai_feedback, stats_context, prompt_style)
+    if cache_key is not None and feedback.get("message") and not feedback.get("error"):
+        _ai_feedback_cache.set(cache_key, feedback)
+    return dict(feedback, cached=False)
+
+
+
+async def _fetch_summoner(platform_host: str, puuid: str) -> Optional[Dict[str, Any]]:
+    try:
+        summoner_url = (
+            f"https://{platform_host}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}"
+        )
+        return await _riot_get_json_async(summoner_url)
+    except (RuntimeError, requests.RequestException):
+        return None
+
+
+async def _fetch_league_entries(
+    platform_host: str, summoner_data: Optional[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """Raw league entries; ``None`` when the call failed (as opposed to unranked)."""
+    encrypted_id = (summoner_data or {}).get("id")
+    if not encrypted_id:
+        return []
+    try:
+        league_url = (
+            f"https://{platform_host}.api.riotgames.com/lol/league/v4/entries/by-summoner/{encrypted_id}"
+        )
+        return await _riot_get_json_async(league_url) or []
+    except (RuntimeError, requests.RequestException):
+        return None
+
+
+async def _load_summoner_and_league(
+    platform_host: str, puuid: str
+) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], bool]:
+    summoner_data = await _fetch_summoner(platform_host, puuid)
+    league_entries = await _fetch_league_entries(platform_host, summoner_data)
+    complete = summoner_data is not None and league_entries is not None
+    return summoner_data, _simplify_league_entries(league_entries or []), complete
+
+
+# (puuid, platform host) -> (summoner_data, simplified league entries, complete).
+_summoner_league_cache = _StaleWhileRevalidateCache(
+    SUMMONER_CACHE_SIZE,
+    SUMMONER_CACHE_FRESH_SECONDS,
+    SUMMONER_CACHE_MAX_STALE_SECONDS,
+    cacheable=lambda value: value[2],
+)
+
+
+async def _fetch_summoner_and_league(
+    platform_host: str, puuid: str
+) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """``(summoner_data, simplified league entries)``, stale-while-revalidate per player."""
+    summoner_data, league_summary, _ = await _summoner_league_cache.get(
+        (puuid, platform_host), lambda: _load_summoner_and_league(platform_host, puuid)
+    )
+    return summoner_data, league_summary
+
+
+async def _load_platform_status(platform_host: str) -> Tuple[str, Dict[str, Any], bool]:
+    try:
+        status_url = f"https://{platform_host}.api.riotgames.com/lol/status/v4/platform-data"
+        status_data = await _riot_get_json_async(status_url)
+        platform_name = status_data.get("name")
+    except (RuntimeError, requests.RequestException):
+        status_data, platform_name = None, platform_host.upper()
+    payload = _build_platform_status_payload(status_data, platform_host, platform_name)
+    return platform_name, payload, status_data is not None
+
+
+# platform host -> (platform_name, simplified status payload, fetched ok).
+_platform_status_cache = _StaleWhileRevalidateCache(
+    64,
+    PLATFORM_STATUS_FRESH_SECONDS,
+    PLATFORM_STATUS_MAX_STALE_SECONDS,
+    cacheable=lambda value: value[2],
+)
+
+
+async def _fetch_platform_status(platform_host: str) -> Tuple[Optional[str], Dict[str, Any]]:
+    """``(platform_name, status payload)``; shared by every recap on the platform."""
+    platform_name, payload, _ = await _platform_status_cache.get(
+        platform_host, lambda: _load_platform_status(platform_host)
+    )
+    return platform_name, payload
+
+
+async def _fetch_enrichment(platform_host: str, puuid: str) -> List[Tuple[Any, Any]]:
+    """Step 4: ``[(summoner_data, league_entries), (platform_name, status_payload)]``."""
+    return await asyncio.gather(
+        _fetch_summoner_and_league(platform_host, puuid),
+        _fetch_platform_status(platform_host),
+    )
+
+
+# ---------- Recap pipeline ----------
+# A stage is ``(dependencies, fn)``; ``fn`` receives the results of finished
+# stages keyed by name and returns this stage's result.
+_PipelineStage = Tuple[Tuple[str, ...], Callable[[Dict[str, Any]], Awaitable[Any]]]
+
+
+class _PipelineAbort(Exception):
+    """Raised by a stage to end the pipeline with a specific HTTP response."""
+
+    def __init__(self, status_code: int, body: Dict[str, Any]) -> None:
+        super().__init__(body.get("error"))
+        self.status_code = status_code
+        self.body = body
+
+
+class _StageSkipped(Exception):
+    pass
+
+
+async def _run_pipeline(
+    stages: Dict[str, _PipelineStage],
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Run ``stages`` as a DAG, starting each one as soon as its dependencies finish.
+
+    Returns ``(results, timings)``. The first stage to raise cancels everything
+    still running and its exception is re-raised; ``timings`` records the wall
+    time and outcome of every stage either way.
+    """
+    results: Dict[str, Any] = {}
+    timings: Dict[str, Dict[str, Any]] = {}
+    tasks: Dict[str, "asyncio.Task[Any]"] = {}
+    pipeline_start = time.monotonic()
+
+    async def _run_stage(name: str, dependencies: Tuple[str, ...], fn: Callable[..., Awaitable[Any]]) -> Any:
+        if dependencies:
+            await asyncio.wait([tasks[dependency] for dependency in dependencies])
+            if any(
+                tasks[dependency].cancelled() or tasks[dependency].exception()
+                for dependency in dependencies
+            ):
+                timings[name] = {"status": "skipped"}
+                raise _StageSkipped(name)
+        started = time.monotonic()
+        status = "error"
+        try:
+            results[name] = await fn(results)
+            status = "ok"
+            return results[name]
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            timings[name] = {
+                "status": status,
+                "startMs": round((started - pipeline_start) * 1000, 1),
+                "ms": round((time.monotonic() - started) * 1000, 1),
+            }
+
+    for name, (dependencies, fn) in stages.items():
+        unknown = [dependency for dependency in dependencies if dependency not in stages]
+        if unknown:
+            raise ValueError(f"Stage {name!r} depends on unknown stages {unknown}")
+        tasks[name] = asyncio.ensure_future(_run_stage(name, dependencies, fn))
+
+    try:
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        timings = {name: timings.get(name, {"status": "cancelled"}) for name in stages}
+
+    for task in tasks.values():
+        error = None if task.cancelled() else task.exception()
+        if error is not None and not isinstance(error, _StageSkipped):
+            raise error
+    return results, timings
+
 
 # ---------- Lambda entry ----------
 def lambda_handler(event, context):
+    return _run_coroutine(lambda_handler_async(event, context))
+
+
+async def lambda_handler_async(event, context):
+    deadline_token = _invocation_deadline.set(_deadline_from_context(context))
+    try:
+        return await _handle_event(event)
+    finally:
+        await _flush_shared_cache_writes()
+        _invocation_deadline.reset(deadline_token)
+
+
+async def _handle_event(event: Dict[str, Any]) -> Dict[str, Any]:
     method = (
         event.get("httpMethod")
         or event.get("requestContext", {}).get("http", {}).get("method", "")
@@ -808,12 +3061,21 @@ def lambda_handler(event, context):
         if body.get("mode") == "ai-feedback":
             stats_context = body.get("stats") or {}
             prompt_style = body.get("promptStyle") or body.get("prompt_style")
-            ai_feedback = _generate_ai_feedback(stats_context, prompt_style)
+            ai_feedback = await _get_ai_feedback(stats_context, prompt_style)
             return _build_response(event, 200, {"aiFeedback": ai_feedback})
 
         game_name = (body.get("game_name") or "").strip() or "Faker"
         tag_line = (body.get("tag_line") or "").strip() or "KR1"
-        region = (body.get("region") or "ASIA").strip().upper()
+        region = body.get("region") or "ASIA"
+        # The routing value becomes the Riot hostname, so only known regions
+        # may reach the client (and its per-host pools, limits and breakers).
+        if not isinstance(region, str) or region.strip().upper() not in DEFAULT_PLATFORM_BY_REGION:
+            return _build_response(
+                event,
+                400,
+                {"error": f"region must be one of {', '.join(DEFAULT_PLATFORM_BY_REGION)}"},
+            )
+        region = region.strip().upper()
         region_label = region
 
         if not RIOT_API_KEY:
@@ -821,138 +3083,338 @@ def lambda_handler(event, context):
 
         routing = region.lower()
 
+        # Filters go to the match-ID endpoint, so only matching games are downloaded.
+        try:
+            match_filters = _parse_match_filters(body)
+        except ValueError as filter_error:
+            return _build_response(event, 400, {"error": str(filter_error)})
+
+        # "depth" asks for a deep-history recap over that many detailed matches;
+        # match IDs are then streamed in pages instead of one 100-ID call.
+        detail_limit = MATCH_DETAIL_LIMIT
+        if body.get("depth") not in (None, ""):
+            depth = body["depth"]
+            try:
+                # "depth": true would become 1 and 2.9 would become 2; reject both.
+                if isinstance(depth, bool) or (isinstance(depth, float) and not depth.is_integer()):
+                    raise TypeError
+                detail_limit = min(MATCH_DEPTH_LIMIT, max(1, int(depth)))
+            except (TypeError, ValueError):
+                return _build_response(event, 400, {"error": "depth must be a number of matches"})
+
+        riot_id = f"{game_name}#{tag_line}"
+
+        # Identical requests within RESPONSE_CACHE_TTL_SECONDS get the stored body
+        # (or a 304) without rebuilding anything.
+        response_key = (riot_id, routing, tuple(sorted(match_filters.items())), detail_limit)
+        stored_response = _response_cache.get(response_key)
+        if stored_response is not None:
+            return _build_etag_response(event, *stored_response)
+        desired_window = max(detail_limit, MATCH_ID_LIMIT)
+        id_fetch_target = min(100, desired_window * 2)
+        if desired_window > 100:
+            # Deep history keeps the same 2x headroom; pages past what the
+            # detail fetcher needs are never requested.
+            id_fetch_target = desired_window * 2
+
         # Step 1: Get PUUID
-        riot_id_url = (
-            f"https://{routing}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/"
-            f"{requests.utils.quote(game_name, safe='')}/"
-            f"{requests.utils.quote(tag_line, safe='')}"
-        )
-        account_data = _riot_get_json(riot_id_url)
-        puuid = account_data.get("puuid")
-        if not puuid:
-            return _build_response(event, 502, {"error": "Missing PUUID in Riot response"})
-
-        # Step 2: Get match IDs
-        match_url = (
-            f"https://{routing}.api.riotgames.com/lol/match/v5/matches/by-puuid/"
-            f"{puuid}/ids"
-        )
-        desired_window = max(MATCH_DETAIL_LIMIT, MATCH_ID_LIMIT)
-        id_fetch_target = min(100, max(desired_window * 2, desired_window))
-        match_ids = _riot_get_json(
-            match_url, params={"count": id_fetch_target}
-        ) or []
-        trimmed_match_ids = match_ids[:MATCH_ID_LIMIT]
+        async def _account_stage(_: Dict[str, Any]) -> str:
+            riot_id_key = _canonical_riot_id(game_name, tag_line, routing)
+            cached_puuid = _puuid_by_riot_id.get(riot_id_key)
+            if cached_puuid:
+                return cached_puuid
+            shared_puuid = await _shared_cache_get(f"riot-id:{riot_id_key}")
+            if shared_puuid:
+                _puuid_by_riot_id.set(riot_id_key, shared_puuid.decode("utf-8"))
+                return shared_puuid.decode("utf-8")
+
+            not_found = _PipelineAbort(
+                404, {"error": f"Riot ID {riot_id} was not found. Check the game name and tag line."}
+            )
+            if f"riot-id:{riot_id_key}" in _negative_cache:
+                raise not_found
 
-        # Step 3: Fetch match details for recap
-        detailed_entries: List[Dict[str, Any]] = []
-        platform_host: Optional[str] = None
-        for match_id in match_ids:
-            detail_url = (
-                f"https://{routing}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+            riot_id_url = (
+                f"https://{routing}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/"
+                f"{requests.utils.quote(game_name, safe='')}/"
+                f"{requests.utils.quote(tag_line, safe='')}"
             )
             try:
-                detail_json = _riot_get_json(detail_url)
-            except RuntimeError:
-                continue
-            entry, platform_id = _extract_match_entry(detail_json, puuid)
-            if not entry:
-                continue
-            detailed_entries.append(entry)
-            if not platform_host and platform_id:
-                platform_host = platform_id.lower()
-            if len(detailed_entries) >= MATCH_DETAIL_LIMIT:
-                break
+                account_data = await _riot_get_json_async(riot_id_url)
+            except RiotApiError as exc:
+                if exc.status_code != 404:
+                    raise
+                _negative_cache.add(f"riot-id:{riot_id_key}")
+                raise not_found from exc
+            puuid = account_data.get("puuid")
+            if not puuid:
+                raise _PipelineAbort(502, {"error": "Missing PUUID in Riot response"})
+            _puuid_by_riot_id.set(riot_id_key, puuid)
+            _schedule_shared_cache_set(
+                f"riot-id:{riot_id_key}", puuid.encode("utf-8"), RIOT_ID_CACHE_TTL_SECONDS
+            )
+            return puuid
+
+        # Step 2: Get match IDs. For a returning player whose last newest match is
+        # still within the head of the list, only the IDs before it are new; Step 3
+        # then fetches just those and splices them onto the stored entries.
+        refresh: Dict[str, Any] = {}
+
+        async def _match_ids_stage(results: Dict[str, Any]) -> _MatchIdStream:
+            puuid = results["account"]
+            match_url = (
+                f"https://{routing}.api.riotgames.com/lol/match/v5/matches/by-puuid/"
+                f"{puuid}/ids"
+            )
+            refresh["key"] = (puuid, routing, tuple(sorted(match_filters.items())), detail_limit)
+            state = _recap_states.get(refresh["key"])
+            if state is not None:
+                known_ids = state[0]
+                head = await _riot_get_json_async(
+                    match_url, params={**match_filters, "count": RECAP_REFRESH_HEAD_COUNT}
+                ) or []
+                if known_ids[0] in head:
+                    refresh["state"] = state
+                    refresh["newIds"] = head[: head.index(known_ids[0])]
+                    _recap_refresh_stats["incremental"] += 1
+                    _recap_refresh_stats["newMatches"] += len(refresh["newIds"])
+                    return _MatchIdStream.from_ids(
+                        refresh["newIds"] + known_ids, keep=MATCH_ID_LIMIT, pages=1
+                    )
+                # Too many new games (or the history changed): rebuild the window.
+                _recap_refresh_stats["headMissed"] += 1
+            return await _MatchIdStream(
+                match_url, match_filters, total=id_fetch_target, keep=MATCH_ID_LIMIT
+            ).start()
 
-        if not detailed_entries:
-            return _build_response(
-                event,
-                404,
-                {"error": "No recent match details available for this Riot ID."},
+        # Step 3: Fetch match details for recap
+        async def _details_stage(
+            results: Dict[str, Any]
+        ) -> Tuple[List[Dict[str, Any]], str, bool, List[str]]:
+            puuid = results["account"]
+            if "state" in refresh:
+                _, known_entries, known_platform = refresh["state"]
+                new_entries, platform_host, partial, failed_ids = await _fetch_match_entries(
+                    routing,
+                    _MatchIdStream.from_ids(refresh["newIds"]),
+                    puuid,
+                    limit=len(refresh["newIds"]),
+                    workers=MATCH_FETCH_WORKERS,
+                )
+                detailed_entries = (new_entries + known_entries)[:detail_limit]
+                platform_host = platform_host or known_platform
+            else:
+                _recap_refresh_stats["full"] += 1
+                detailed_entries, platform_host, partial, failed_ids = await _fetch_match_entries(
+                    routing,
+                    results["matchIds"],
+                    puuid,
+                    limit=detail_limit,
+                    workers=MATCH_FETCH_WORKERS,
+                )
+            if not detailed_entries:
+                if partial:
+                    raise _PipelineAbort(
+                        504, {"error": "Ran out of time before any match details arrived."}
+                    )
+                if match_filters:
+                    raise _PipelineAbort(
+                        404, {"error": "No matches found for this Riot ID with these filters."}
+                    )
+                raise _PipelineAbort(
+                    404, {"error": "No recent match details available for this Riot ID."}
+                )
+            if platform_host:
+                _platform_by_puuid.set(puuid, platform_host)
+            # A match that failed this time must not end up behind the stored head,
+            # or later refreshes would treat it as known and never fetch it again.
+            # Keeping the previous state means the next refresh retries it.
+            if failed_ids:
+                _recap_refresh_stats["notSavedAfterFailures"] += 1
+            elif (
+                not partial
+                and results["matchIds"].head
+                and not (results["matchIds"].truncated and len(detailed_entries) < detail_limit)
+            ):
+                _recap_states.set(
+                    refresh["key"], (results["matchIds"].head, detailed_entries, platform_host)
+                )
+            platform_host = platform_host or DEFAULT_PLATFORM_BY_REGION.get(region, "na1")
+            return detailed_entries, platform_host, partial, failed_ids
+
+        # Step 4 starts speculatively on the platform this player was last seen on
+        # (or the region default) so it overlaps Steps 2-3; it is only re-issued if
+        # the match details point at a different platform.
+        async def _platform_guess_stage(results: Dict[str, Any]) -> str:
+            return _platform_by_puuid.get(results["account"]) or DEFAULT_PLATFORM_BY_REGION.get(
+                region, "na1"
             )
 
-        platform_host = platform_host or DEFAULT_PLATFORM_BY_REGION.get(region, "na1")
+        # The guess may be the wrong platform, so a failure there must not end the
+        # pipeline: these stages return None instead and Step 4 is re-issued.
+        async def _summoner_stage(
+            results: Dict[str, Any],
+        ) -> Optional[Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]]:
+            try:
+                return await _fetch_summoner_and_league(results["platformGuess"], results["account"])
+            except (RuntimeError, requests.RequestException) as exc:
+                print(f"⚠️ Speculative summoner lookup on {results['platformGuess']} failed: {exc!r:.120}")
+                return None
+
+        async def _status_stage(
+            results: Dict[str, Any],
+        ) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+            try:
+                return await _fetch_platform_status(results["platformGuess"])
+            except (RuntimeError, requests.RequestException) as exc:
+                print(f"⚠️ Speculative status lookup on {results['platformGuess']} failed: {exc!r:.120}")
+                return None
+
+        async def _enrichment_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+            platform_host = results["details"][1]
+            guessed_right = platform_host == results["platformGuess"]
+            summoner_league = results["summoner"] if guessed_right else None
+            platform_status = results["status"] if guessed_right else None
+            if summoner_league is None and platform_status is None:
+                summoner_league, platform_status = await _fetch_enrichment(
+                    platform_host, results["account"]
+                )
+            elif summoner_league is None:
+                summoner_league = await _fetch_summoner_and_league(platform_host, results["account"])
+            elif platform_status is None:
+                platform_status = await _fetch_platform_status(platform_host)
+            summoner_data, league_entries = summoner_league
+            platform_name, status_payload = platform_status
+            return {
+                "summoner": summoner_data,
+                "league": league_entries,
+                "platformName": platform_name,
+                "status": status_payload,
+            }
+
+        async def _recap_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+            enrichment = results["enrichment"]
+            return _build_recap_payload(
+                riot_id,
+                region_label,
+                results["details"][0],
+                enrichment["league"],
+                enrichment["platformName"],
+            )
 
-        # Step 4: Enriched data (Summoner + League + Status)
-        summoner_data: Optional[Dict[str, Any]] = None
-        league_entries: List[Dict[str, Any]] = []
-        platform_name = None
-        status_data: Optional[Dict[str, Any]] = None
-        try:
-            summoner_url = (
-                f"https://{platform_host}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}"
+        async def _profile_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+            return _build_profile_payload(
+                riot_id, results["details"][1], results["enrichment"]["summoner"]
             )
-            summoner_data = _riot_get_json(summoner_url)
-            encrypted_id = summoner_data.get("id")
-            if encrypted_id:
-                league_url = (
-                    f"https://{platform_host}.api.riotgames.com/lol/league/v4/entries/by-summoner/{encrypted_id}"
-                )
-                league_entries = _riot_get_json(league_url) or []
-        except RuntimeError:
-            league_entries = []
 
-        try:
-            status_url = f"https://{platform_host}.api.riotgames.com/lol/status/v4/platform-data"
-            status_data = _riot_get_json(status_url)
-            platform_name = status_data.get("name")
-        except RuntimeError:
-            platform_name = platform_host.upper()
-            status_data = None
-
-        recap_payload = _build_recap_payload(
-            f"{game_name}#{tag_line}",
-            region_label,
-            detailed_entries,
-            league_entries,
-            platform_name,
-        )
-        profile_payload = _build_profile_payload(
-            f"{game_name}#{tag_line}",
-            platform_host,
-            summoner_data,
-        )
-        league_payload = _simplify_league_entries(league_entries)
-        platform_payload = _build_platform_status_payload(
-            status_data,
-            platform_host,
-            platform_name,
+        async def _league_summary_stage(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+            # Already simplified (and cached per player) when it was fetched.
+            return results["enrichment"]["league"]
+
+        async def _platform_status_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+            # Built (and cached per platform) when the status was fetched.
+            return results["enrichment"]["status"]
+
+        async def _advanced_metrics_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+            return _build_advanced_metrics(results["details"][0])
+
+        results, timings = await _run_pipeline(
+            {
+                "account": ((), _account_stage),
+                "matchIds": (("account",), _match_ids_stage),
+                "details": (("matchIds",), _details_stage),
+                "platformGuess": (("account",), _platform_guess_stage),
+                "summoner": (("platformGuess",), _summoner_stage),
+                "status": (("platformGuess",), _status_stage),
+                "enrichment": (("details", "summoner", "status"), _enrichment_stage),
+                "recap": (("details", "enrichment"), _recap_stage),
+                "profile": (("enrichment",), _profile_stage),
+                "leagueSummary": (("enrichment",), _league_summary_stage),
+                "platformStatus": (("enrichment",), _platform_status_stage),
+                "advancedMetrics": (("details",), _advanced_metrics_stage),
+            }
         )
-        advanced_metrics = _build_advanced_metrics(detailed_entries)
 
+        match_ids = results["matchIds"]
+        detailed_entries, platform_host, partial, failed_ids = results["details"]
+        # A failed match-ID page leaves a shorter history than asked for; report it
+        # like a deadline cut and keep it out of the caches.
+        truncated = match_ids.truncated and len(detailed_entries) < detail_limit
+        recap_payload = results["recap"]
         stats_context = _build_ai_stats_context(
             recap_payload,
-            profile_payload,
-            league_payload,
-            platform_payload,
-            advanced_metrics,
-            detailed_entries,
+            results["profile"],
+            results["leagueSummary"],
+            results["platformStatus"],
+            results["advancedMetrics"],
+            detailed_entries[:MATCH_DETAIL_LIMIT],
         )
-        return _build_response(
-            event,
-            200,
-            {
-                "summoner": recap_payload["summoner"],
-                "region": region,
-                "matches": trimmed_match_ids,
-                "recap": recap_payload,
-                "profile": profile_payload,
-                "leagueSummary": league_payload,
-                "platformStatus": platform_payload,
-                "advancedMetrics": advanced_metrics,
-                "aiStatsContext": stats_context,
-                "limits": {
-                    "matchIdLimit": MATCH_ID_LIMIT,
-                    "matchDetailLimit": MATCH_DETAIL_LIMIT,
-                    "matchHistoryLimit": MATCH_HISTORY_LIMIT,
-                    "idFetchWindow": id_fetch_target,
-                    "idsReturned": len(match_ids),
-                    "detailedMatches": len(detailed_entries),
+        response_body = {
+            "summoner": recap_payload["summoner"],
+            "region": region,
+            "matches": match_ids.head,
+            "recap": recap_payload,
+            "profile": results["profile"],
+            "leagueSummary": results["leagueSummary"],
+            "platformStatus": results["platformStatus"],
+            "advancedMetrics": results["advancedMetrics"],
+            "aiStatsContext": stats_context,
+            "limits": {
+                "matchIdLimit": MATCH_ID_LIMIT,
+                "matchDetailLimit": detail_limit,
+                "matchHistoryLimit": MATCH_HISTORY_LIMIT,
+                "idFetchWindow": id_fetch_target,
+                "idsReturned": match_ids.fetched,
+                "idPages": match_ids.pages,
+                "detailedMatches": len(detailed_entries),
+                "matchFetchWorkers": MATCH_FETCH_WORKERS,
+                "partial": partial or truncated,
+                "partialReason": "deadline" if partial else ("matchIdPageFailed" if truncated else None),
+                "incrementalRefresh": "state" in refresh,
+                "newMatches": len(refresh["newIds"]) if "state" in refresh else None,
+                "failedMatches": len(failed_ids),
+                "filters": match_filters,
+            },
+            "diagnostics": {
+                "timings": timings,
+                "enrichment": {
+                    "speculativePlatform": results["platformGuess"],
+                    "reissued": platform_host != results["platformGuess"],
+                },
+                "connections": _connection_pool_stats(),
+                "caches": {
+                    "riotId": _puuid_by_riot_id.stats(),
+                    "platform": _platform_by_puuid.stats(),
+                    "shared": dict(_shared_cache_stats, enabled=_shared_cache_backend is not None),
+                    "matchDetails": _match_detail_cache.snapshot(),
+                    "matchEntries": _match_entries.stats(),
+                    "platformStatus": _platform_status_cache.snapshot(),
+                    "summonerLeague": _summoner_league_cache.snapshot(),
+                    "negative": _negative_cache.snapshot(),
+                    "responses": _response_cache.stats(),
+                    "recapState": dict(_recap_states.stats(), **_recap_refresh_stats),
                 },
+                "jsonCodec": _json_codec_name,
+                "rateLimits": _rate_limiter.snapshot(),
+                "retries": {
+                    method: dict(counts) for method, counts in _retry_stats.items() if counts
+                },
+                "coalescing": dict(_coalescing_stats),
+                "hedging": dict(_hedge_stats, enabled=ENABLE_MATCH_HEDGING),
+                "circuitBreakers": _circuit_breaker_snapshot(),
             },
-        )
-
-
+        }
+        # Matches that failed this time are retried by the next request, so the
+        # response must not be replayed (or 304'd) in the meantime.
+        if partial or truncated or failed_ids:
+            return _build_response(event, 200, response_body)
+        etag, body_text = _store_recap_response(response_key, response_body)
+        return _build_etag_response(event, etag, body_text)
+
+    except _PipelineAbort as abort:
+        return _build_response(event, abort.status_code, abort.body)
+    except RiotDeadlineExceeded as deadline_error:
+        return _build_response(event, 504, {"error": str(deadline_error)})
     except requests.RequestException as request_error:
         return _build_response(
             event,
@@ -963,3 +3425,4 @@ def lambda_handler(event, context):
         return _build_response(event, 502, {"error": str(runtime_error)})
     except Exception as exc:  # pragma: no cover - defensive
         return _build_response(event, 500, {"error": str(exc)})
+
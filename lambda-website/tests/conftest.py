@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# lambda_function and its bundled dependencies live in lambda-website/.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
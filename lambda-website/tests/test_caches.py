@@ -0,0 +1,101 @@
+"""Caches: the negative-lookup Bloom filter, stale-while-revalidate refreshes and the file tier."""
+
+import asyncio
+import time
+
+import lambda_function
+
+
+def test_negative_cache_remembers_keys_for_one_rotation():
+    cache = lambda_function._NegativeCache(capacity=4, ttl_seconds=600, error_rate=0.01)
+    first = [f"match:KR_{index}" for index in range(4)]
+    for key in first:
+        cache.add(key)
+    assert all(key in cache for key in first)
+
+    # A full generation is rotated out; its keys are still found in the previous one.
+    second = [f"match:KR_{index}" for index in range(4, 7)]
+    for key in second:
+        cache.add(key)
+    assert cache.stats["rotations"] == 1
+    assert all(key in cache for key in first + second)
+
+    cache.add("match:KR_7")
+    cache.add("match:KR_8")
+    assert cache.stats["rotations"] == 2
+    assert all(key in cache for key in second)
+    assert sum(key in cache for key in first) <= 1  # only a false positive could remain
+
+
+def test_negative_cache_rotates_after_half_its_ttl():
+    cache = lambda_function._NegativeCache(capacity=1000, ttl_seconds=0.1, error_rate=0.01)
+    cache.add("riot-id:asia:nobody#0000")
+    time.sleep(0.06)
+    assert "riot-id:asia:nobody#0000" in cache
+    assert cache.snapshot()["current"] == 0
+    time.sleep(0.06)
+    assert "riot-id:asia:nobody#0000" not in cache
+    assert cache.stats["rotations"] == 2
+
+
+def test_negative_cache_has_no_false_negatives_and_fixed_size():
+    cache = lambda_function._NegativeCache(capacity=500, ttl_seconds=600, error_rate=0.01)
+    size = cache.snapshot()["bytes"]
+    keys = [f"match:NA1_{index}" for index in range(500)]
+    for key in keys:
+        cache.add(key)
+    assert all(key in cache for key in keys)
+    assert cache.snapshot()["bytes"] == size
+    false_positives = sum(f"match:EUW1_{index}" in cache for index in range(2000))
+    assert false_positives < 2000 * 0.03
+
+
+def test_stale_refresh_neither_blocks_the_flush_nor_inherits_the_deadline():
+    cache = lambda_function._StaleWhileRevalidateCache(8, fresh_seconds=0, max_stale_seconds=60)
+    seen_deadlines = []
+
+    async def _load_old():
+        return "old"
+
+    async def _load_new():
+        seen_deadlines.append(lambda_function._invocation_deadline.get())
+        await asyncio.sleep(0.3)
+        return "new"
+
+    async def _first_invocation():
+        lambda_function._invocation_deadline.set(time.monotonic() + 0.05)
+        await cache.get("key", _load_old)
+        value = await cache.get("key", _load_new)
+        started = time.monotonic()
+        await lambda_function._flush_shared_cache_writes()
+        return value, time.monotonic() - started
+
+    value, flush_seconds = lambda_function._run_coroutine(_first_invocation())
+    assert value == "old"
+    assert flush_seconds < 0.1
+    assert cache.stats["refreshes"] == 0
+
+    async def _later_invocation():
+        await asyncio.gather(*cache._refreshing.values())
+        return cache.stats["refreshes"], await cache.get("key", _load_old)
+
+    assert lambda_function._run_coroutine(_later_invocation()) == (1, "new")
+    assert seen_deadlines == [None]
+
+
+def test_file_cache_overwrites_do_not_inflate_its_size(tmp_path):
+    backend = lambda_function.LocalFileCacheBackend(str(tmp_path), max_bytes=1000)
+    backend.set("other", b"x" * 100)
+    for round_ in range(50):
+        backend.set("key", bytes([round_]) * 100)
+    on_disk = sum(path.stat().st_size for path in tmp_path.iterdir())
+    assert backend._bytes == on_disk == 2 * (100 + backend._HEADER.size)
+    assert backend.get("other") == b"x" * 100
+    assert backend.get("key") == bytes([49]) * 100
+
+
+def test_file_cache_leaves_no_temp_files(tmp_path):
+    backend = lambda_function.LocalFileCacheBackend(str(tmp_path))
+    backend.set("key", b"value", ttl_seconds=60)
+    assert [path.name for path in tmp_path.iterdir()] == [backend._path("key").rsplit("/", 1)[1]]
+    assert backend.get("key") == b"value"
@@ -0,0 +1,319 @@
+"""Request handling in ``_handle_event`` against a scripted Riot API.
+
+``_riot_get_json_async`` is replaced by :class:`_Riot`, which serves accounts,
+match IDs and match details from in-memory data, and every cache the handler
+touches is swapped for a fresh one so tests do not see each other's state.
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import lambda_function
+
+PUUID = "player-puuid"
+
+
+class _Riot:
+    """A Riot API stand-in: ``history`` is the player's match IDs, newest first."""
+
+    def __init__(self):
+        self.urls = []
+        self.history = [f"KR_{number}" for number in range(300, 0, -1)]
+        self.failing = {}  # match ID -> status code to answer with
+        self.failing_pages = set()  # "start" values of match-ID pages that fail
+        self.detail_delay = 0.0
+
+    def play(self, games):
+        """Prepend ``games`` new matches to the history."""
+        newest = int(self.history[0].split("_")[1])
+        self.history[:0] = [f"KR_{newest + offset}" for offset in range(games, 0, -1)]
+
+    def details_fetched(self):
+        return [url.rsplit("/", 1)[1] for url in self.urls if "/matches/KR_" in url]
+
+    def id_requests(self):
+        return [url for url in self.urls if url.endswith("/ids")]
+
+    def _match(self, match_id):
+        number = int(match_id.split("_")[1])
+        participants = [
+            {
+                "puuid": PUUID if index == 0 else f"other-{index}",
+                "teamId": 100 if index < 5 else 200,
+                "championName": f"Champion{number % 7}",
+                "teamPosition": "MIDDLE",
+                "win": number % 2 == 0,
+                "kills": number % 11,
+                "deaths": 3,
+                "assists": 7,
+                "totalMinionsKilled": 160,
+                "neutralMinionsKilled": 8,
+                "goldEarned": 11000,
+                "totalDamageDealtToChampions": 19000,
+                "visionScore": 22,
+            }
+            for index in range(10)
+        ]
+        info = {
+            "gameId": number,
+            "gameDuration": 1500 + number,
+            "platformId": "KR",
+            "queueId": 420,
+            "participants": participants,
+        }
+        return {"metadata": {"matchId": match_id}, "info": info}
+
+    def _answer(self, url, params):
+        path = url.split(".api.riotgames.com", 1)[1]
+        if "/accounts/by-riot-id/" in path:
+            if "Nobody" in path:
+                raise lambda_function.RiotApiError("not found", status_code=404)
+            return {"puuid": PUUID, "gameName": "Faker", "tagLine": "KR1"}
+        if path.endswith("/ids"):
+            start = int((params or {}).get("start", 0))
+            if start in self.failing_pages:
+                raise lambda_function.RiotApiError("failed", status_code=503)
+            return self.history[start:start + int((params or {}).get("count", 20))]
+        if "/matches/" in path:
+            match_id = path.rsplit("/", 1)[1]
+            if match_id in self.failing:
+                raise lambda_function.RiotApiError("failed", status_code=self.failing[match_id])
+            return self._match(match_id)
+        if "/summoners/by-puuid/" in path:
+            return {"id": "encrypted", "summonerLevel": 300, "profileIconId": 1}
+        if "/entries/by-summoner/" in path:
+            return []
+        if path.endswith("/platform-data"):
+            return {"name": "Korea", "incidents": [], "maintenances": []}
+        raise lambda_function.RiotApiError("not found", status_code=404)
+
+    async def get_json(self, url, *, params=None, decode=None, **kwargs):
+        self.urls.append(url)
+        if self.detail_delay and "/matches/KR_" in url:
+            await asyncio.sleep(self.detail_delay)
+        data = self._answer(url, params)
+        return decode(json.dumps(data).encode("utf-8")) if decode else data
+
+
+@pytest.fixture
+def riot(monkeypatch):
+    stub = _Riot()
+    monkeypatch.setattr(lambda_function, "RIOT_API_KEY", "test-key")
+    monkeypatch.setattr(lambda_function, "_riot_get_json_async", stub.get_json)
+    monkeypatch.setattr(lambda_function, "_shared_cache_backend", None)
+    monkeypatch.setattr(
+        lambda_function, "_match_detail_cache", lambda_function._MatchDetailCache(1 << 24, "", 0)
+    )
+    for name in (
+        "_match_entries", "_recap_states", "_response_cache", "_puuid_by_riot_id", "_platform_by_puuid"
+    ):
+        fresh = lambda_function._LRUCache(256, ttl_seconds=getattr(lambda_function, name).ttl_seconds)
+        monkeypatch.setattr(lambda_function, name, fresh)
+    monkeypatch.setattr(lambda_function, "_negative_cache", lambda_function._NegativeCache(1000, 600, 0.01))
+    for name in ("_summoner_league_cache", "_platform_status_cache"):
+        monkeypatch.setattr(
+            lambda_function, name, lambda_function._StaleWhileRevalidateCache(16, 600, 600)
+        )
+    return stub
+
+
+def _handle(headers=None, deadline_in=None, **body):
+    body = {"game_name": "Faker", "tag_line": "KR1", "region": "ASIA", **body}
+    event = {"httpMethod": "POST", "body": json.dumps(body), "headers": headers or {}}
+
+    async def _run():
+        if deadline_in is not None:
+            lambda_function._invocation_deadline.set(time.monotonic() + deadline_in)
+        return await lambda_function._handle_event(event)
+
+    response = lambda_function._run_coroutine(_run())
+    return response, json.loads(response["body"] or "null")
+
+
+def _refresh(riot, **body):
+    """A later request for the same recap, once its stored response has expired."""
+    lambda_function._response_cache._data.clear()
+    del riot.urls[:]
+    return _handle(**body)
+
+
+def _stored_head():
+    """Newest match ID of the one stored refresh state."""
+    (_, (match_ids, _, _)), = lambda_function._recap_states._data.values()
+    return match_ids[0]
+
+
+def _rebuilt(**body):
+    """The same recap built from scratch, for comparison with an incremental one."""
+    lambda_function._recap_states._data.clear()
+    lambda_function._match_entries._data.clear()
+    lambda_function._response_cache._data.clear()
+    return _handle(**body)[1]
+
+
+@pytest.mark.parametrize("region", ["evil.com#", "europe.evil.com", "NA", 7, ["ASIA"]])
+def test_unknown_region_is_rejected_before_any_riot_call(riot, region):
+    pools = set(lambda_function._connection_pools)
+    breakers = set(lambda_function._circuit_breakers)
+    response, body = _handle(region=region)
+    assert response["statusCode"] == 400
+    assert "region" in body["error"]
+    assert riot.urls == []
+    assert set(lambda_function._connection_pools) == pools
+    assert set(lambda_function._circuit_breakers) == breakers
+
+
+@pytest.mark.parametrize("region", ["sea", " Europe ", "AMERICAS"])
+def test_known_regions_are_normalized_to_their_routing_host(riot, region):
+    _handle(game_name="Nobody", region=region)
+    routing = region.strip().lower()
+    assert riot.urls[0].startswith(f"https://{routing}.api.riotgames.com/riot/account/")
+
+
+def test_response_with_failed_matches_is_not_cached(riot):
+    failed = riot.history[3]
+    riot.failing[failed] = 503
+    response, body = _handle()
+    assert response["statusCode"] == 200
+    assert "ETag" not in response["headers"]
+    assert body["limits"]["failedMatches"] == 1
+    assert len(lambda_function._response_cache._data) == 0
+
+    # The next request rebuilds and retries the failed match.
+    del riot.failing[failed]
+    response, body = _handle()
+    assert riot.details_fetched().count(failed) == 2
+    assert body["limits"]["failedMatches"] == 0
+    assert "ETag" in response["headers"]
+
+
+# ---------- Incremental refresh ----------
+def test_refresh_fetches_only_new_matches_when_the_head_matches(riot):
+    _handle()
+    riot.play(3)
+    response, body = _refresh(riot)
+    assert response["statusCode"] == 200
+    assert riot.details_fetched() == riot.history[:3]
+    assert riot.id_requests() == [
+        "https://asia.api.riotgames.com/lol/match/v5/matches/by-puuid/player-puuid/ids"
+    ]
+    assert body["limits"]["incrementalRefresh"] is True
+    assert body["limits"]["newMatches"] == 3
+    assert body["matches"] == riot.history[: lambda_function.MATCH_ID_LIMIT]
+    assert _stored_head() == riot.history[0]
+    rebuilt = _rebuilt()
+    assert rebuilt["limits"]["incrementalRefresh"] is False
+    assert body["recap"] == rebuilt["recap"]
+    assert body["advancedMetrics"] == rebuilt["advancedMetrics"]
+
+
+def test_refresh_without_new_games_fetches_no_details(riot):
+    _, first = _handle()
+    _, body = _refresh(riot)
+    assert riot.details_fetched() == []
+    assert body["limits"]["incrementalRefresh"] is True
+    assert body["limits"]["newMatches"] == 0
+    assert (body["matches"], body["recap"]) == (first["matches"], first["recap"])
+
+
+def test_refresh_rebuilds_when_the_stored_head_is_out_of_reach(riot):
+    _handle()
+    riot.play(lambda_function.RECAP_REFRESH_HEAD_COUNT)
+    _, body = _refresh(riot)
+    assert body["limits"]["incrementalRefresh"] is False
+    assert len(riot.id_requests()) == 2  # the head probe, then the full window
+    assert body["matches"] == riot.history[: lambda_function.MATCH_ID_LIMIT]
+    assert body["recap"] == _rebuilt()["recap"]
+
+
+def test_failed_new_match_is_retried_by_the_next_refresh(riot):
+    _handle()
+    known_head = riot.history[0]
+    riot.play(2)
+    newest = riot.history[0]
+    riot.failing[newest] = 503
+    _, body = _refresh(riot)
+    assert body["limits"]["failedMatches"] == 1
+    assert _stored_head() == known_head
+
+    # Both games are still new to the stored state; only the failed one is refetched.
+    del riot.failing[newest]
+    _, body = _refresh(riot)
+    assert riot.details_fetched() == [newest]
+    assert body["limits"]["newMatches"] == 2
+    assert body["limits"]["failedMatches"] == 0
+    assert body["recap"] == _rebuilt()["recap"]
+
+
+def test_truncated_history_is_not_stored_as_refresh_state(riot):
+    riot.failing_pages.add(lambda_function.MATCH_ID_PAGE_SIZE)
+    response, body = _handle(depth=lambda_function.MATCH_ID_PAGE_SIZE + 20)
+    assert response["statusCode"] == 200
+    assert body["limits"]["partialReason"] == "matchIdPageFailed"
+    assert body["limits"]["detailedMatches"] == lambda_function.MATCH_ID_PAGE_SIZE
+    assert "ETag" not in response["headers"]
+    assert len(lambda_function._recap_states._data) == 0
+    assert len(lambda_function._response_cache._data) == 0
+
+
+def test_deadline_cut_window_is_not_stored_as_refresh_state(riot):
+    riot.detail_delay = 0.05
+    response, body = _handle(deadline_in=0.2)
+    assert response["statusCode"] == 200
+    assert body["limits"]["partialReason"] == "deadline"
+    assert 0 < body["limits"]["detailedMatches"] < lambda_function.MATCH_DETAIL_LIMIT
+    assert "ETag" not in response["headers"]
+    assert len(lambda_function._recap_states._data) == 0
+
+    riot.detail_delay = 0.0
+    _, body = _refresh(riot)
+    assert body["limits"]["incrementalRefresh"] is False
+    assert body["limits"]["detailedMatches"] == lambda_function.MATCH_DETAIL_LIMIT
+
+
+# ---------- ETags ----------
+def test_matching_if_none_match_gets_an_empty_304(riot):
+    response, _ = _handle()
+    etag = response["headers"]["ETag"]
+    assert etag.startswith('W/"')
+
+    cached, _ = _handle(headers={"If-None-Match": etag})
+    assert (cached["statusCode"], cached["body"]) == (304, "")
+    assert cached["headers"]["ETag"] == etag
+
+    other, body = _handle(headers={"if-none-match": 'W/"something-else"'})
+    assert other["statusCode"] == 200
+    assert body["recap"]
+
+
+def test_rebuilt_response_keeps_its_etag_when_only_diagnostics_change(riot):
+    first, _ = _handle()
+    etag = first["headers"]["ETag"]
+    response, _ = _refresh(riot, headers={"If-None-Match": etag.lstrip("W/")})
+    assert response["statusCode"] == 304
+    assert response["headers"]["ETag"] == etag
+
+    riot.play(1)
+    response, _ = _refresh(riot, headers={"If-None-Match": etag})
+    assert response["statusCode"] == 200
+    assert response["headers"]["ETag"] != etag
+
+
+# ---------- Request validation ----------
+@pytest.mark.parametrize("depth", [True, False, 2.9, "2.9", "deep", [40], {"n": 40}])
+def test_bad_depth_is_rejected(riot, depth):
+    response, body = _handle(depth=depth)
+    assert response["statusCode"] == 400
+    assert body == {"error": "depth must be a number of matches"}
+    assert riot.urls == []
+
+
+@pytest.mark.parametrize("depth, detailed", [(30, 30), ("30", 30), (30.0, 30), (0, 1)])
+def test_depth_sets_the_number_of_detailed_matches(riot, depth, detailed):
+    response, body = _handle(depth=depth)
+    assert response["statusCode"] == 200
+    assert body["limits"]["matchDetailLimit"] == detailed
+    assert body["limits"]["detailedMatches"] == detailed
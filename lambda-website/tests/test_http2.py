@@ -0,0 +1,188 @@
+"""Tests for the opt-in HTTP/2 transport against a local TLS + h2 server.
+
+Skipped unless the ``h2`` package is installed and ``openssl`` is available to
+make a throwaway certificate; the Lambda zip does not bundle h2.
+"""
+
+import asyncio
+import json
+import shutil
+import ssl
+import subprocess
+
+import pytest
+
+import lambda_function
+
+pytest.importorskip("h2")
+if lambda_function.h2 is None:  # pragma: no cover - h2 became importable after lambda_function
+    pytest.skip("lambda_function was imported without h2", allow_module_level=True)
+if shutil.which("openssl") is None:  # pragma: no cover
+    pytest.skip("openssl is needed for a test certificate", allow_module_level=True)
+
+import h2.config  # noqa: E402
+import h2.connection  # noqa: E402
+import h2.events  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("cert")
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return str(cert), str(key)
+
+
+class _Server:
+    """Answers every request with its path as JSON, after ``delay`` seconds."""
+
+    def __init__(self, certificate, alpn, delay=0.05):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(*certificate)
+        self.context.set_alpn_protocols([alpn])
+        self.delay = delay
+        self.connections = 0
+        self.streams = 0
+        self.max_concurrent = 0
+        self._active = 0
+        self.port = None
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        if writer.get_extra_info("ssl_object").selected_alpn_protocol() != "h2":
+            await self._handle_http11(reader, writer)
+            return
+        conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+
+        async def respond(stream_id, headers):
+            self._active += 1
+            self.max_concurrent = max(self.max_concurrent, self._active)
+            await asyncio.sleep(self.delay)
+            self._active -= 1
+            body = json.dumps({"path": headers[":path"], "protocol": "h2"}).encode()
+            conn.send_headers(
+                stream_id,
+                [(":status", "200"), ("content-type", "application/json"),
+                 ("content-length", str(len(body)))],
+            )
+            conn.send_data(stream_id, body, end_stream=True)
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    self.streams += 1
+                    asyncio.ensure_future(respond(event.stream_id, dict(event.headers)))
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+    async def _handle_http11(self, reader, writer):
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            path = request_line.split()[1].decode()
+            body = json.dumps({"path": path, "protocol": "http/1.1"}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+
+
+@pytest.fixture
+def http2_client(monkeypatch, certificate):
+    """Route Riot connections to the local server, trusting its certificate."""
+    target = {}
+
+    async def _open(host, port, use_tls, http2=False):
+        context = ssl.create_default_context(cafile=certificate[0])
+        context.check_hostname = False
+        if http2:
+            context.set_alpn_protocols(["h2", "http/1.1"])
+        return await asyncio.open_connection(
+            "127.0.0.1", target["port"], ssl=context, server_hostname="localhost"
+        )
+
+    monkeypatch.setattr(lambda_function, "ENABLE_RIOT_HTTP2", True)
+    monkeypatch.setattr(lambda_function, "_open_riot_connection", _open)
+    return target
+
+
+def _get_all(host, count):
+    return asyncio.gather(
+        *(
+            lambda_function._http_get_async(f"https://{host}/item/{index}?n={index}", headers={}, timeout=5)
+            for index in range(count)
+        )
+    )
+
+
+def test_concurrent_requests_share_one_h2_connection(http2_client, certificate):
+    async def _run():
+        async with _Server(certificate, "h2") as server:
+            http2_client["port"] = server.port
+            responses = await _get_all("h2-shared.test", 8)
+            return server, responses
+
+    server, responses = asyncio.run(_run())
+    assert [json.loads(body) for _, _, body in responses] == [
+        {"path": f"/item/{index}?n={index}", "protocol": "h2"} for index in range(8)
+    ]
+    assert {status for status, _, _ in responses} == {200}
+    assert server.connections == 1
+    assert server.streams == 8
+    assert server.max_concurrent > 1
+    pool = lambda_function._get_connection_pool("h2-shared.test", 443, True)
+    assert pool.http2 is True
+
+
+def test_http11_fallback_when_alpn_declines_h2(http2_client, certificate):
+    async def _run():
+        async with _Server(certificate, "http/1.1") as server:
+            http2_client["port"] = server.port
+            return await _get_all("h2-fallback.test", 3)
+
+    responses = asyncio.run(_run())
+    assert [json.loads(body)["protocol"] for _, _, body in responses] == ["http/1.1"] * 3
+    assert lambda_function._get_connection_pool("h2-fallback.test", 443, True).http2 is False
+
+
+def test_h2_timeout_leaves_the_connection_usable(http2_client, certificate):
+    async def _run():
+        async with _Server(certificate, "h2", delay=0.5) as server:
+            http2_client["port"] = server.port
+            with pytest.raises(lambda_function.requests.exceptions.Timeout):
+                await lambda_function._http_get_async("https://h2-timeout.test/slow", headers={}, timeout=0.1)
+            server.delay = 0
+            status, _, body = await lambda_function._http_get_async(
+                "https://h2-timeout.test/fast", headers={}, timeout=5
+            )
+            return server, status, body
+
+    server, status, body = asyncio.run(_run())
+    assert (status, json.loads(body)["path"]) == (200, "/fast")
+    assert server.connections == 1
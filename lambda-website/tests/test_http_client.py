@@ -0,0 +1,186 @@
+"""Tests for the asyncio HTTP/1.1 client used for Riot calls.
+
+They run against a local ``http.server``, so no network access is needed.
+"""
+
+import asyncio
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import lambda_function
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/echo":
+            body = json.dumps({"query": query}).encode()
+            self._send(200, body, [("Content-Length", str(len(body)))])
+        elif path == "/chunked":
+            self._send(200, headers=[("Transfer-Encoding", "chunked")])
+            for piece in (b'{"parts": ', b"[1, 2, 3]", b"}"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.write(b"0\r\n\r\n")
+        elif path == "/gzip":
+            body = gzip.compress(json.dumps({"compressed": True}).encode())
+            self._send(
+                200,
+                body,
+                [("Content-Encoding", "gzip"), ("Content-Length", str(len(body)))],
+            )
+        elif path == "/no-content":
+            self._send(204)
+        elif path == "/not-modified":
+            self._send(304, headers=[("ETag", '"abc"')])
+        elif path == "/until-close":
+            self.close_connection = True
+            self._send(200, b'{"closed": true}', [("Connection", "close")])
+        else:
+            self._send(404, b"{}", [("Content-Length", "2")])
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url, params=None, timeout=2.0):
+    return lambda_function._run_coroutine(
+        lambda_function._http_get_async(url, headers={}, params=params, timeout=timeout)
+    )
+
+
+def _pool_stats(url):
+    port = int(url.rsplit(":", 1)[1])
+    return dict(lambda_function._get_connection_pool("127.0.0.1", port, False).stats)
+
+
+def _read(raw):
+    async def _run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        first = await lambda_function._read_http_response(reader)
+        rest = await reader.read()
+        return first, rest
+
+    return asyncio.run(_run())
+
+
+def test_read_chunked_with_extensions_and_trailers():
+    raw = (
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"3;name=value\r\nabc\r\n2\r\nde\r\n0\r\nX-Trailer: 1\r\n\r\n"
+        b"NEXT"
+    )
+    (status, headers, body), rest = _read(raw)
+    assert (status, body, rest) == (200, b"abcde", b"NEXT")
+    assert headers["transfer-encoding"] == "chunked"
+
+
+def test_read_content_length_leaves_next_response_unread():
+    raw = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nX-A: 1\r\nX-A: 2\r\n\r\nokNEXT"
+    (status, headers, body), rest = _read(raw)
+    assert (status, body, rest) == (200, b"ok", b"NEXT")
+    assert headers["x-a"] == "1, 2"
+
+
+def test_read_without_length_reads_to_eof():
+    (status, _, body), rest = _read(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nall of it")
+    assert (status, body, rest) == (200, b"all of it", b"")
+
+
+@pytest.mark.parametrize("status", [204, 304])
+def test_read_bodiless_statuses_do_not_consume_the_stream(status):
+    raw = b"HTTP/1.1 %d X\r\nETag: \"e\"\r\n\r\nHTTP/1.1 200 OK\r\n" % status
+    (code, _, body), rest = _read(raw)
+    assert (code, body, rest) == (status, b"", b"HTTP/1.1 200 OK\r\n")
+
+
+def test_read_skips_interim_responses():
+    raw = b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    (status, _, body), _ = _read(raw)
+    assert (status, body) == (200, b"ok")
+
+
+def test_read_rejects_malformed_status_line():
+    with pytest.raises(ConnectionError):
+        _read(b"SSH-2.0-OpenSSH\r\n\r\n")
+
+
+def test_chunked_response(server_url):
+    status, _, body = _get(f"{server_url}/chunked")
+    assert status == 200
+    assert json.loads(body) == {"parts": [1, 2, 3]}
+
+
+def test_gzip_response_is_decoded(server_url):
+    status, headers, body = _get(f"{server_url}/gzip")
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert json.loads(body) == {"compressed": True}
+
+
+def test_keep_alive_connection_is_reused(server_url):
+    _get(f"{server_url}/echo")
+    before = _pool_stats(server_url)
+    for _ in range(3):
+        assert _get(f"{server_url}/echo")[0] == 200
+    after = _pool_stats(server_url)
+    assert after["newConnections"] == before["newConnections"]
+    assert after["reusedConnections"] == before["reusedConnections"] + 3
+
+
+@pytest.mark.parametrize("path, status", [("/no-content", 204), ("/not-modified", 304)])
+def test_bodiless_responses_return_immediately_and_keep_the_connection(server_url, path, status):
+    _get(f"{server_url}/echo")
+    before = _pool_stats(server_url)
+    started = time.monotonic()
+    code, _, body = _get(f"{server_url}{path}", timeout=2.0)
+    assert (code, body) == (status, b"")
+    assert time.monotonic() - started < 1.0
+    assert _get(f"{server_url}/echo")[0] == 200
+    assert _pool_stats(server_url)["newConnections"] == before["newConnections"]
+
+
+def test_connection_close_response_is_not_pooled(server_url):
+    before = _pool_stats(server_url)
+    status, _, body = _get(f"{server_url}/until-close")
+    assert (status, json.loads(body)) == (200, {"closed": True})
+    assert _pool_stats(server_url)["discardedConnections"] == before["discardedConnections"] + 1
+
+
+def test_params_are_merged_with_the_url_query(server_url):
+    _, _, body = _get(f"{server_url}/echo?queue=420", params={"start": 0, "count": 20})
+    assert json.loads(body)["query"] == "queue=420&start=0&count=20"
+    _, _, body = _get(f"{server_url}/echo?queue=420")
+    assert json.loads(body)["query"] == "queue=420"
+
+
+def test_unreachable_host_maps_to_requests_connection_error():
+    with pytest.raises(lambda_function.requests.exceptions.ConnectionError):
+        _get("http://127.0.0.1:9/echo", timeout=2.0)
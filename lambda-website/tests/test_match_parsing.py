@@ -0,0 +1,138 @@
+"""The projected match parses must yield the same recap entries as a full parse."""
+
+import copy
+import json
+
+import pytest
+
+import lambda_function
+
+PUUID = "player-puuid"
+
+
+def _participant(index, puuid=None, **overrides):
+    participant = {
+        "puuid": puuid or f"other-{index}",
+        "teamId": 100 if index < 5 else 200,
+        "championName": f"Champion{index}",
+        "teamPosition": "MIDDLE",
+        "individualPosition": "MIDDLE",
+        "win": index < 5,
+        "kills": index,
+        "deaths": 2,
+        "assists": 6,
+        "totalMinionsKilled": 170,
+        "neutralMinionsKilled": 12,
+        "goldEarned": 11500,
+        "totalDamageDealtToChampions": 21000,
+        "damageDealtToObjectives": 7000,
+        "visionScore": 25,
+        "pentaKills": 0,
+        "largestMultiKill": 2,
+        "challenges": {"kda": 3.5, "gameLength": 1800, "killParticipation": 0.5},
+        "perks": {"styles": [{"style": 8000, "selections": [{"perk": 8005}]}]},
+    }
+    participant.update(overrides)
+    return participant
+
+
+def _match(**info_overrides):
+    participants = [_participant(index, PUUID if index == 2 else None) for index in range(10)]
+    info = {
+        "gameId": 123,
+        "gameDuration": 1800,
+        "platformId": "KR",
+        "queueId": 420,
+        "participants": participants,
+        "teams": [{"teamId": 100, "win": True, "objectives": {"baron": {"kills": 1}}}],
+    }
+    info.update(info_overrides)
+    return {"metadata": {"dataVersion": "2", "matchId": "KR_123", "participants": []}, "info": info}
+
+
+def _without_match_id():
+    match = _match()
+    match["metadata"] = {"dataVersion": "2"}
+    return match
+
+
+def _with_missing_team_id():
+    match = _match()
+    del match["info"]["participants"][2]["teamId"]
+    del match["info"]["participants"][7]["teamId"]
+    return match
+
+
+def _without_participants():
+    match = _match()
+    del match["info"]["participants"]
+    return match
+
+
+def _with_penta():
+    match = _match()
+    match["info"]["participants"][2].update(pentaKills=1, largestMultiKill=5)
+    return match
+
+
+CASES = {
+    "regular": _match(),
+    "metadata without matchId": _without_match_id(),
+    "participants without teamId": _with_missing_team_id(),
+    "player not in match": _match(participants=[_participant(index) for index in range(10)]),
+    "info without participants": _without_participants(),
+    "legacy millisecond duration": _match(gameDuration=None, gameLength=1_750_000),
+    "remake": _match(gameDuration=200),
+    "penta": _with_penta(),
+    "no info": {"metadata": {"matchId": "KR_1"}},
+}
+
+
+def _parsers():
+    projection = lambda_function._MatchProjection(PUUID)
+    parsers = {
+        "full": lambda body: json.loads(body),
+        "projected, json hook": projection.parse_with_hook,
+    }
+    if "orjson" in lambda_function._JSON_CODECS:
+        parsers["projected, orjson + trim"] = lambda body: projection.project(
+            lambda_function._JSON_CODECS["orjson"](body)
+        )
+    return parsers
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_projected_parses_extract_the_same_entry(case):
+    body = json.dumps(CASES[case]).encode("utf-8")
+    entries = {
+        name: lambda_function._extract_match_entry(parse(body), PUUID)
+        for name, parse in _parsers().items()
+    }
+    expected = entries.pop("full")
+    for name, entry in entries.items():
+        assert entry == expected, name
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_hook_and_trim_produce_the_same_shape(case):
+    pytest.importorskip("orjson")
+    projection = lambda_function._MatchProjection(PUUID)
+    body = json.dumps(CASES[case]).encode("utf-8")
+    assert projection.parse_with_hook(body) == projection.project(json.loads(body))
+
+
+def test_projection_keeps_only_what_the_recap_reads():
+    projection = lambda_function._MatchProjection(PUUID)
+    projected = projection.parse_with_hook(json.dumps(_match()).encode("utf-8"))
+    assert projected["metadata"] == {"matchId": "KR_123"}
+    assert set(projected["info"]) == {"gameId", "gameDuration", "platformId", "queueId", "participants"}
+    player, other = projected["info"]["participants"][2], projected["info"]["participants"][0]
+    assert set(player) <= lambda_function._MATCH_PLAYER_FIELDS
+    assert set(other) == {"puuid", "teamId", "kills"}
+
+
+def test_projection_does_not_mutate_its_input():
+    match = _match()
+    original = copy.deepcopy(match)
+    lambda_function._MatchProjection(PUUID).project(match)
+    assert match == original
@@ -0,0 +1,269 @@
+"""Retry, circuit-breaker and deadline behaviour of the Riot request wrapper.
+
+``_http_get_async`` is replaced by a scripted transport, so nothing leaves the process.
+"""
+
+import asyncio
+import itertools
+import time
+
+import pytest
+
+import lambda_function
+
+_hosts = itertools.count()
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Answer Riot calls from ``transport.replies``; ``"timeout"`` sleeps out the call timeout."""
+
+    class _Transport:
+        def __init__(self):
+            self.replies = []
+            self.timeouts = []
+
+        async def get(self, url, *, headers, params=None, timeout):
+            self.timeouts.append(timeout)
+            reply = self.replies.pop(0) if self.replies else 200
+            if reply == "timeout":
+                await asyncio.sleep(timeout)
+                raise lambda_function.requests.exceptions.Timeout(f"timed out: {url}")
+            if reply == "refused":
+                raise lambda_function.requests.exceptions.ConnectionError(f"refused: {url}")
+            return reply, {}, b'{"ok": true}' if reply == 200 else b"{}"
+
+    stub = _Transport()
+    monkeypatch.setattr(lambda_function, "RIOT_API_KEY", "test-key")
+    monkeypatch.setattr(lambda_function, "_http_get_async", stub.get)
+    monkeypatch.setattr(lambda_function, "_retry_delay", lambda attempt, retry_after: 0.0)
+    return stub
+
+
+def _summoner_url():
+    # A fresh host per call gives every test its own breaker and rate-limit windows.
+    return f"https://test{next(_hosts)}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/p"
+
+
+def _breaker(url):
+    return lambda_function._get_circuit_breaker(*lambda_function._riot_endpoint(url))
+
+
+def _request(url, timeout=15, deadline_in=None):
+    async def _run():
+        if deadline_in is not None:
+            lambda_function._invocation_deadline.set(time.monotonic() + deadline_in)
+        return await lambda_function._riot_request_json_async(url, timeout=timeout)
+
+    return lambda_function._run_coroutine(_run())
+
+
+def test_deadline_shortened_timeout_does_not_count_against_the_breaker(transport):
+    url = _summoner_url()
+    transport.replies = ["timeout"]
+    with pytest.raises(lambda_function.RiotDeadlineExceeded):
+        _request(url, timeout=5, deadline_in=0.2)
+    assert transport.timeouts[0] < 5
+    assert _breaker(url).failures == 0
+    assert _breaker(url).state == "closed"
+
+
+def test_full_timeouts_count_as_failures(transport):
+    url = _summoner_url()
+    transport.replies = ["timeout"] * (lambda_function.RIOT_MAX_RETRIES + 1)
+    with pytest.raises(lambda_function.requests.exceptions.Timeout):
+        _request(url, timeout=0.2)
+    assert set(transport.timeouts) == {0.2}
+    assert _breaker(url).failures == len(transport.timeouts)
+
+
+def test_connection_errors_count_even_under_a_deadline(transport):
+    url = _summoner_url()
+    transport.replies = ["refused"] * (lambda_function.RIOT_MAX_RETRIES + 1)
+    with pytest.raises(lambda_function.requests.exceptions.ConnectionError):
+        _request(url, timeout=5, deadline_in=1.0)
+    assert _breaker(url).failures == len(transport.timeouts)
+
+
+# ---------- Circuit breaker ----------
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(lambda_function, "RIOT_BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(lambda_function, "RIOT_BREAKER_COOLDOWN_SECONDS", 0.05)
+    return lambda_function._CircuitBreaker()
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert (breaker.state, breaker.allow()) == ("closed", True)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+    assert breaker.snapshot() == {
+        "opened": 1, "rejected": 1, "state": "open", "consecutiveFailures": 3
+    }
+
+
+def test_half_open_breaker_lets_one_probe_through(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    assert breaker.state == "half-open"
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert (breaker.state, breaker.failures, breaker.allow()) == ("closed", 0, True)
+
+
+def test_failed_probe_reopens_and_released_probe_frees_the_slot(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.release()
+    assert breaker.allow() is True  # the released probe's slot went to this call
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+    assert breaker.stats["opened"] == 2
+
+
+def test_open_breaker_serves_the_last_good_response(transport):
+    url = _summoner_url()
+    assert _request(url) == {"ok": True}
+    breaker = _breaker(url)
+    breaker.state, breaker.opened_at = "open", time.monotonic()
+    assert _request(url) == {"ok": True}
+    assert len(transport.timeouts) == 1
+    assert breaker.stats["servedLastGood"] == 1
+
+
+# ---------- Rate limits ----------
+@pytest.fixture
+def full_headroom(monkeypatch):
+    monkeypatch.setattr(lambda_function, "RIOT_RATE_LIMIT_HEADROOM", 1.0)
+
+
+def test_window_waits_for_the_oldest_send_in_the_log_to_age_out(full_headroom):
+    window = lambda_function._RateLimitWindow(3, 10)
+    for stamp in (100.0, 101.0, 102.0):
+        assert window.wait_time(stamp) == 0.0
+        window.consume(stamp)
+    assert window.wait_time(103.0) == pytest.approx(7.0)
+    assert window.spare(103.0) == 0
+    # Once the first send is a full window old, one slot opens again.
+    assert window.wait_time(110.0) == 0.0
+    assert window.spare(110.0) == 1
+
+
+def test_window_keeps_headroom_below_the_limit(monkeypatch):
+    monkeypatch.setattr(lambda_function, "RIOT_RATE_LIMIT_HEADROOM", 0.5)
+    window = lambda_function._RateLimitWindow(20, 1)
+    assert window.allowance == 10
+
+
+def test_reported_counts_top_up_the_log(full_headroom):
+    window = lambda_function._RateLimitWindow(5, 10)
+    sent_at = time.monotonic()
+    window.consume(sent_at)
+    window.observe_count(4, sent_at)
+    assert len(window.sent) == 4
+    assert window.spare(sent_at) == 1
+    window.observe_count(2, sent_at)  # a stale, lower count never removes sends
+    assert len(window.sent) == 4
+
+
+def test_scheduler_syncs_limits_from_headers_and_honours_429(full_headroom):
+    scheduler = lambda_function._RateLimitScheduler()
+    host, method = "kr.api.riotgames.com", "match-v5.getMatch"
+    sent_at = lambda_function._run_coroutine(scheduler.acquire(host, method))
+    scheduler.observe(
+        host, method, sent_at, 200,
+        {"x-method-rate-limit": "2:10", "x-method-rate-limit-count": "2:10"},
+    )
+    assert scheduler.snapshot()[host]["methods"][method] == "2:10"
+    assert scheduler.spare_capacity(host, method) == 0
+
+    other = "match-v5.getMatchIdsByPUUID"
+    scheduler.observe(
+        host, other, time.monotonic(), 429,
+        {"retry-after": "5", "x-rate-limit-type": "application"},
+    )
+    assert scheduler.spare_capacity(host, other) == 0
+    assert scheduler.snapshot()[host]["throttled"] == 1
+
+
+# ---------- Request coalescing ----------
+@pytest.fixture
+def shared_request(monkeypatch):
+    """Replace the underlying request; it honours the caller's deadline like the real one."""
+    calls = []
+
+    async def _request_json(url, *, params=None, timeout=15, decode=None):
+        calls.append(lambda_function._invocation_deadline.get())
+        await asyncio.sleep(0.1)
+        deadline = lambda_function._invocation_deadline.get()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise lambda_function.RiotDeadlineExceeded("deadline")
+        return {"call": len(calls)}
+
+    monkeypatch.setattr(lambda_function, "_riot_request_json_async", _request_json)
+    return calls
+
+
+def test_identical_concurrent_calls_share_one_request(shared_request):
+    async def _run():
+        return await asyncio.gather(
+            *(lambda_function._riot_get_json_async("https://kr.example/a") for _ in range(3))
+        )
+
+    assert lambda_function._run_coroutine(_run()) == [{"call": 1}] * 3
+    assert len(shared_request) == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_request(shared_request):
+    async def _run():
+        first = asyncio.ensure_future(lambda_function._riot_get_json_async("https://kr.example/b"))
+        second = asyncio.ensure_future(lambda_function._riot_get_json_async("https://kr.example/b"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert lambda_function._run_coroutine(_run()) == ({"call": 1}, True)
+    assert len(shared_request) == 1
+
+
+def test_last_caller_leaving_cancels_the_shared_request(shared_request):
+    async def _run():
+        caller = asyncio.ensure_future(lambda_function._riot_get_json_async("https://kr.example/c"))
+        await asyncio.sleep(0.01)
+        entry, = [
+            entry for key, entry in lambda_function._inflight_requests.items() if key[1].endswith("/c")
+        ]
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        return entry[0].cancelled(), entry[1]
+
+    assert lambda_function._run_coroutine(_run()) == (True, 0)
+
+
+def test_follower_reissues_when_the_leader_runs_out_of_its_deadline(shared_request):
+    async def _leader():
+        lambda_function._invocation_deadline.set(time.monotonic() + 0.05)
+        return await lambda_function._riot_get_json_async("https://kr.example/d")
+
+    async def _follower():
+        await asyncio.sleep(0.01)
+        return await lambda_function._riot_get_json_async("https://kr.example/d")
+
+    async def _run():
+        return await asyncio.gather(_leader(), _follower(), return_exceptions=True)
+
+    leader, follower = lambda_function._run_coroutine(_run())
+    assert isinstance(leader, lambda_function.RiotDeadlineExceeded)
+    assert follower == {"call": 2}
+    assert shared_request[0] is not None and shared_request[1] is None